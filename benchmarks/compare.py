@@ -0,0 +1,77 @@
+"""Compare the results of two runs of benchmarks.endpoints and flag
+regressions. Run with:
+
+    python -m benchmarks.compare BASELINE CANDIDATE [--threshold PERCENT]
+
+Exits with a status of 1 if the throughput of any kind of request fell, or
+any of its latency percentiles rose, by more than the threshold.
+
+"""
+
+import argparse
+import json
+
+# The measurements compared, and whether a higher value is better.
+MEASUREMENTS = (("throughput", True), ("p50", False), ("p95", False),
+                ("p99", False))
+
+
+def compare(baseline, candidate, threshold):
+    """Return a list of (name, measurement, baseline, candidate, change,
+    regressed) tuples for the kinds of request in both sets of results. The
+    change is a percentage, and regressed is whether it is worse than
+    threshold percent.
+
+    """
+
+    rows = []
+    names = sorted(set(baseline["endpoints"]) & set(candidate["endpoints"]))
+
+    for name in names + ["overall"]:
+        before = baseline["overall"] if name == "overall" \
+            else baseline["endpoints"][name]
+        after = candidate["overall"] if name == "overall" \
+            else candidate["endpoints"][name]
+
+        for measurement, higher_is_better in MEASUREMENTS:
+            old, new = before[measurement], after[measurement]
+            if not old or new is None:
+                continue
+
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            rows.append((name, measurement, old, new, change,
+                         worse > threshold))
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="the percentage change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    if baseline.get("parameters") != candidate.get("parameters"):
+        print("Warning: the runs used different parameters.")
+
+    rows = compare(baseline, candidate, args.threshold)
+
+    for name, measurement, old, new, change, regressed in rows:
+        print("{0:>12} {1:>10} {2:>10.2f} {3:>10.2f} {4:>+8.1f}%{5}".format(
+            name, measurement, old, new, change,
+            "  REGRESSION" if regressed else ""))
+
+    if any(r[-1] for r in rows):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Generate a synthetic dataset of users and their posts. Run with:
+
+    python -m benchmarks.dataset PATH [--users N] [--posts-per-user N]
+                                      [--body-size N] [--seed N]
+
+The same arguments always produce the same dataset.
+
+"""
+
+import argparse
+import random
+import string
+
+from posts import db
+from posts.models import Post, User
+
+WORDS = ["".join(random.Random(i).choice(string.ascii_lowercase)
+                 for _ in range(3 + i % 6)) for i in range(1000)]
+
+
+def text(rng, size):
+    """Return roughly size characters of words chosen by rng."""
+
+    words = []
+    length = 0
+
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+
+    return " ".join(words)[:size]
+
+
+def generate(users, posts_per_user, body_size, seed=0):
+    """Add users, each with posts_per_user posts with bodies of body_size
+    characters, to the current database. Returns a dictionary describing the
+    dataset, including the IDs of the users and (user ID, post ID) pairs for
+    the posts.
+
+    """
+
+    rng = random.Random(seed)
+    user_ids = []
+    posts = []
+
+    # Insert in batches to bound memory use on large datasets.
+    batch = max(1, 10000 // max(posts_per_user, 1))
+
+    for start in range(0, users, batch):
+        with db.get_session() as DB:
+            ids = User.bulk_create(DB, [
+                {"name": text(rng, 12), "email": "user{0}@example.com"
+                 .format(i)} for i in range(start, min(start + batch, users))])
+
+            rows = [{"title": text(rng, 40), "body": text(rng, body_size),
+                     "user_id": id_}
+                    for id_ in ids for _ in range(posts_per_user)]
+
+            if rows:
+                posts += zip((r["user_id"] for r in rows),
+                             Post.bulk_create(DB, rows))
+
+        user_ids += ids
+
+    return {"users": users, "posts_per_user": posts_per_user,
+            "body_size": body_size, "seed": seed,
+            "user_ids": user_ids, "posts": posts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("path", help="the database file to create")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts-per-user", type=int, default=10)
+    parser.add_argument("--body-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    db.init(args.path)
+    db.create_schema()
+    try:
+        dataset = generate(args.users, args.posts_per_user, args.body_size,
+                           args.seed)
+    finally:
+        db.dispose()
+
+    print("Created {0} users and {1} posts in {2}.".format(
+        len(dataset["user_ids"]), len(dataset["posts"]), args.path))
+
+
+if __name__ == "__main__":
+    main()
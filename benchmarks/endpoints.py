@@ -0,0 +1,307 @@
+"""Drive every endpoint of the app with a mix of traffic from concurrent
+clients, and report the throughput and latency percentiles of each kind of
+request. Run with:
+
+    python -m benchmarks.endpoints [--users N] [--posts-per-user N]
+                                   [--body-size N] [--requests N]
+                                   [--concurrency N] [--mix NAME=WEIGHT,...]
+                                   [--config NAME=VALUE ...] [--output PATH]
+
+Requests are made through the app's test client, so the results measure the
+app and database rather than a web server or network. The results are
+written as JSON to the output path, and can be compared between runs with
+benchmarks.compare.
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from posts import db
+from posts.app import create_app
+
+from .dataset import WORDS, generate
+
+# The requests which make up the traffic, and how often each is made by
+# default relative to the others.
+MIX = {
+    "list_users": 5,
+    "view_user": 15,
+    "list_posts": 15,
+    "stream_posts": 1,
+    "view_post": 35,
+    "search": 5,
+    "create_user": 3,
+    "update_user": 3,
+    "delete_user": 1,
+    "bulk_users": 1,
+    "create_post": 8,
+    "update_post": 6,
+    "delete_post": 3,
+    "bulk_posts": 2,
+}
+
+
+class Client(object):
+    """Makes requests of each kind against a dataset, keeping track of the
+    users and posts it has created.
+
+    """
+
+    def __init__(self, app, dataset, rng, name):
+        self.client = app.test_client()
+        self.dataset = dataset
+        self.rng = rng
+        self.name = name
+        self.count = 0
+        self.created_users = []
+        self.created_posts = []
+
+    def user_id(self):
+        return self.rng.choice(self.dataset["user_ids"])
+
+    def post(self):
+        return self.rng.choice(self.dataset["posts"])
+
+    def body(self):
+        return {"title": "Benchmark post",
+                "body": " ".join(self.rng.choice(WORDS) for _ in range(50))}
+
+    def list_users(self):
+        return self.client.get("/api/user?after={0}".format(
+            self.rng.randrange(len(self.dataset["user_ids"]))))
+
+    def view_user(self):
+        return self.client.get("/api/user/{0}".format(self.user_id()))
+
+    def list_posts(self):
+        return self.client.get("/api/user/{0}/post".format(self.user_id()))
+
+    def view_post(self):
+        return self.client.get("/api/user/{0}/post/{1}".format(*self.post()))
+
+    def stream_posts(self):
+        return self.client.get("/api/user/{0}/post?stream=true".format(
+            self.user_id()))
+
+    def search(self):
+        return self.client.get("/api/post/search?q={0}&limit=20".format(
+            self.rng.choice(WORDS)))
+
+    def new_user(self):
+        self.count += 1
+        return {"name": "Benchmark",
+                "email": "{0}-{1}@example.com".format(self.name, self.count)}
+
+    def create_user(self):
+        rv = self.client.post("/api/user", data=json.dumps(self.new_user()))
+
+        if rv.status_code == 201:
+            self.created_users.append(json.loads(rv.data)["id"])
+
+        return rv
+
+    def update_user(self):
+        return self.client.put("/api/user/{0}".format(self.user_id()),
+                               data=json.dumps({"name": "Renamed"}))
+
+    def delete_user(self):
+        if not self.created_users:
+            return self.create_user()
+
+        return self.client.delete("/api/user/{0}".format(
+            self.created_users.pop()))
+
+    def bulk_users(self):
+        return self.client.post("/api/user/bulk", data=json.dumps(
+            [self.new_user() for _ in range(10)]))
+
+    def create_post(self):
+        user_id = self.user_id()
+        rv = self.client.post("/api/user/{0}/post".format(user_id),
+                              data=json.dumps(self.body()))
+
+        if rv.status_code == 201:
+            self.created_posts.append((user_id, json.loads(rv.data)["id"]))
+
+        return rv
+
+    def update_post(self):
+        return self.client.put("/api/user/{0}/post/{1}".format(*self.post()),
+                               data=json.dumps({"title": "Renamed"}))
+
+    def delete_post(self):
+        # Only delete users and posts created by the benchmark, so that the
+        # dataset which the reads use stays the same.
+        if not self.created_posts:
+            return self.create_post()
+
+        return self.client.delete("/api/user/{0}/post/{1}".format(
+            *self.created_posts.pop()))
+
+    def bulk_posts(self):
+        return self.client.post("/api/user/{0}/post/bulk".format(
+            self.user_id()), data=json.dumps([self.body() for _ in range(10)]))
+
+
+def percentile(ordered, fraction):
+    """Return the nearest-rank percentile of a sorted list."""
+
+    if not ordered:
+        return None
+
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarise(latencies, errors, elapsed):
+    """Return the throughput and latency percentiles, in milliseconds, of a
+    list of latencies in seconds.
+
+    """
+
+    ordered = sorted(latencies)
+
+    return {"requests": len(ordered),
+            "errors": errors,
+            "throughput": len(ordered) / elapsed if elapsed else None,
+            "p50": percentile(ordered, 0.5) * 1000 if ordered else None,
+            "p95": percentile(ordered, 0.95) * 1000 if ordered else None,
+            "p99": percentile(ordered, 0.99) * 1000 if ordered else None}
+
+
+def run(app, dataset, mix, requests, concurrency, seed):
+    """Make requests from concurrency threads, with each kind of request
+    chosen in proportion to its weight in mix. Returns a dictionary of the
+    results, overall and for each kind of request.
+
+    """
+
+    names = sorted(mix)
+    weights = [mix[n] for n in names]
+    latencies = {n: [] for n in names}
+    errors = {n: 0 for n in names}
+    lock = threading.Lock()
+
+    def worker(index, count):
+        rng = random.Random(seed + index)
+        client = Client(app, dataset, rng, "client{0}".format(index))
+
+        for name in rng.choices(names, weights, k=count):
+            start = time.perf_counter()
+            rv = getattr(client, name)()
+            rv.get_data()  # Read the whole of a streamed response.
+            latency = time.perf_counter() - start
+
+            with lock:
+                latencies[name].append(latency)
+                if rv.status_code >= 400:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(
+        i, requests // concurrency + (i < requests % concurrency)))
+        for i in range(concurrency)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = {"elapsed": elapsed,
+               "overall": summarise(sum(latencies.values(), []),
+                                    sum(errors.values()), elapsed),
+               "endpoints": {n: summarise(latencies[n], errors[n], elapsed)
+                             for n in names if latencies[n]}}
+    return results
+
+
+def parse_mix(value):
+    mix = {}
+
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in MIX:
+            raise argparse.ArgumentTypeError(
+                "Unknown request kind '{0}'. Choose from: {1}".format(
+                    name, ", ".join(sorted(MIX))))
+        mix[name] = float(weight)
+
+    return mix
+
+
+def parse_config(value):
+    name, _, setting = value.partition("=")
+
+    try:
+        return name, json.loads(setting)
+    except ValueError:
+        return name, setting
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts-per-user", type=int, default=10)
+    parser.add_argument("--body-size", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", type=parse_mix, default=MIX,
+                        help="the weight of each kind of request, which "
+                             "defaults to a mostly read mix of all of them")
+    parser.add_argument("--config", type=parse_config, action="append",
+                        default=[], help="an app setting, as NAME=VALUE "
+                                         "where VALUE may be JSON")
+    parser.add_argument("--output", help="the file to write results to")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp()
+
+    try:
+        app = create_app(dict(args.config, DATABASE_PATH=path,
+                              DATABASE_CREATE_SCHEMA=True))
+
+        dataset = generate(args.users, args.posts_per_user, args.body_size,
+                           args.seed)
+        results = run(app, dataset, args.mix, args.requests,
+                      args.concurrency, args.seed)
+    finally:
+        db.dispose()
+        os.close(fd)
+        for filename in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+    results["parameters"] = {
+        "users": args.users, "posts_per_user": args.posts_per_user,
+        "body_size": args.body_size, "requests": args.requests,
+        "concurrency": args.concurrency, "seed": args.seed, "mix": args.mix,
+        "config": dict(args.config)}
+    results["environment"] = {"python": platform.python_version(),
+                              "sqlite": sqlite3.sqlite_version,
+                              "platform": platform.platform()}
+
+    print("{0:>12} {1:>8} {2:>7} {3:>10} {4:>8} {5:>8} {6:>8}".format(
+        "", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    for name, r in sorted(results["endpoints"].items()) + \
+            [("overall", results["overall"])]:
+        print("{0:>12} {1:>8} {2:>7} {3:>10.1f} {4:>8.2f} {5:>8.2f} "
+              "{6:>8.2f}".format(name, r["requests"], r["errors"],
+                                 r["throughput"], r["p50"], r["p95"],
+                                 r["p99"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
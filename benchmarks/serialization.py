@@ -0,0 +1,77 @@
+"""Compare reading and serialising posts through the ORM with the Core read
+path. Run with:
+
+    python -m benchmarks.serialization [--posts N] [--page-size N]
+
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+from posts import db
+from posts.models import Post, User
+
+
+def populate(posts, body_size):
+    """Add a single user with the given number of posts to the database."""
+
+    with db.get_session() as DB:
+        user = User.create(DB, name="Benchmark", email="bench@example.com")
+        DB.flush()
+
+        body = "x" * body_size
+        Post.bulk_create(DB, [{"title": "Post {0}".format(i), "body": body,
+                               "user_id": user.id} for i in range(posts)])
+
+    return user.id
+
+
+def orm_page(user_id, page_size):
+    with db.get_session() as DB:
+        posts = Post.page(DB, 0, page_size, Post.user_id == user_id)
+        return [p.to_dict() for p in posts]
+
+
+def core_page(user_id, page_size):
+    with db.get_session() as DB:
+        return Post.read_page(DB, 0, page_size, Post.user_id == user_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--body-size", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp()
+
+    try:
+        db.init(path)
+        db.create_schema()
+        user_id = populate(args.posts, args.body_size)
+
+        assert orm_page(user_id, 10) == core_page(user_id, 10)
+
+        results = {}
+        for name, function in (("orm", orm_page), ("core", core_page)):
+            times = timeit.repeat(lambda: function(user_id, args.page_size),
+                                  number=1, repeat=args.repeat)
+            results[name] = min(times)
+            print("{0:>5}: {1:8.2f} ms per page of {2}".format(
+                name, results[name] * 1000, args.page_size))
+
+        print("speedup: {0:.1f}x".format(results["orm"] / results["core"]))
+    finally:
+        db.dispose()
+        os.close(fd)
+        for filename in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+
+if __name__ == "__main__":
+    main()
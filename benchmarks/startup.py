@@ -0,0 +1,69 @@
+"""Measure how long a new process takes to import the app, create it and
+serve its first request. Run with:
+
+    python -m benchmarks.startup [--repeat N]
+
+Each measurement is made in a fresh Python process, as for a newly started
+container, and the median of the runs is reported.
+
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CREATE_SCHEMA = """
+import sys
+from posts import db
+db.init(sys.argv[1])
+db.create_schema()
+db.dispose()
+"""
+
+# Run in each fresh process, printing its timings in milliseconds as JSON.
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+from posts.app import create_app
+imported = time.perf_counter()
+app = create_app({"DATABASE_PATH": sys.argv[1]})
+created = time.perf_counter()
+app.test_client().get("/api/user")
+served = time.perf_counter()
+print(json.dumps({"import": (imported - start) * 1000,
+                  "create_app": (created - imported) * 1000,
+                  "first_request": (served - created) * 1000,
+                  "total": (served - start) * 1000}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp()
+
+    try:
+        subprocess.check_call([sys.executable, "-c", CREATE_SCHEMA, path])
+
+        runs = [json.loads(subprocess.check_output(
+            [sys.executable, "-c", MEASURE, path]).decode())
+            for _ in range(args.repeat)]
+    finally:
+        os.close(fd)
+        for filename in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+    for phase in ("import", "create_app", "first_request", "total"):
+        print("{0:>14}: {1:8.1f} ms".format(
+            phase, statistics.median(r[phase] for r in runs)))
+
+
+if __name__ == "__main__":
+    main()
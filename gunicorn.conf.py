@@ -0,0 +1,74 @@
+"""Gunicorn settings for serving the app in production. Run with:
+
+    gunicorn --config gunicorn.conf.py posts.wsgi:app
+
+Each setting can be changed with an environment variable:
+
+- POSTS_BIND: the address to listen on. Defaults to 0.0.0.0:80.
+- POSTS_WORKERS: the number of worker processes. Defaults to the number of
+                 CPUs.
+- POSTS_THREADS: the number of threads serving requests in each worker.
+                 Defaults to 4, and should not exceed the connection pool's
+                 DATABASE_POOL_SIZE plus DATABASE_POOL_MAX_OVERFLOW.
+- POSTS_KEEPALIVE: the number of seconds to hold an idle connection open.
+                   Defaults to 5.
+- POSTS_TIMEOUT: the number of seconds a worker may spend on a request before
+                 it is restarted. Defaults to 30.
+- POSTS_GRACEFUL_TIMEOUT: the number of seconds workers are given to finish
+                          their requests when restarting. Defaults to 30.
+- POSTS_MAX_REQUESTS: restart each worker after this many requests, or never
+                      if 0. Defaults to 0.
+
+Sending SIGHUP to the master process reloads the settings and gracefully
+replaces the workers, which finish the requests they are serving first.
+
+The database schema must have been created with "python manage.py
+create-schema" first. The app is loaded once in the master process, which
+does not connect to the database, and the workers are forked from it. Any
+connections the master holds are closed before forking, and each worker then
+creates its own engine and connection pool, because a SQLite connection must
+not be used by more than one process.
+
+SQLite allows any number of concurrent readers but only one writer at a time,
+across all of the workers. In WAL mode, which both SQLITE_PRESETS use, reads
+are not blocked by a write. A write which finds the database locked waits for
+up to the busy_timeout setting and then fails, so adding workers adds read
+throughput but not write throughput. The response cache, metrics and pool
+statistics are kept separately by each worker.
+
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("POSTS_BIND", "0.0.0.0:80")
+workers = int(os.environ.get("POSTS_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("POSTS_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+keepalive = int(os.environ.get("POSTS_KEEPALIVE", 5))
+timeout = int(os.environ.get("POSTS_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("POSTS_GRACEFUL_TIMEOUT", 30))
+max_requests = int(os.environ.get("POSTS_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+preload_app = True
+
+
+def pre_fork(server, worker):
+    """Close the master's database connections so that no worker inherits
+    them.
+
+    """
+
+    from posts import db
+
+    db.dispose()
+
+
+def post_fork(server, worker):
+    """Give the worker its own database engine."""
+
+    from posts.app import init_db
+    from posts.wsgi import app
+
+    init_db(app)
@@ -0,0 +1,199 @@
+"""Command line tools for managing the posts database. Run with:
+
+    python manage.py <command> [options]
+
+"""
+
+import argparse
+import os
+import sys
+
+from posts import db, purge, transfer
+from posts.app import create_app
+from posts.db import backup, sharding
+
+
+def create_schema(app, args):
+    """Create the database tables and indexes, if they do not exist."""
+
+    db.create_schema()
+    print("Created the schema.")
+
+
+def rebuild_search(app, args):
+    """Rebuild the full-text search index of posts from the posts table."""
+
+    if not db.search_enabled():
+        raise SystemExit("SQLite does not support FTS5.")
+
+    db.rebuild_search()
+    print("Rebuilt the search index.")
+
+
+def positive_int(value):
+    number = int(value)
+
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+
+    return number
+
+
+def report(message):
+    print(message, file=sys.stderr)
+
+
+def open_file(path, mode):
+    """Open a file, or standard input or output if the path is "-"."""
+
+    if path == "-":
+        return open((sys.stdin if mode == "r" else sys.stdout).fileno(),
+                    mode, newline="", closefd=False)
+
+    return open(path, mode, newline="")
+
+
+def import_table(app, args):
+    """Import users or posts from a file of newline delimited JSON or CSV."""
+
+    format_ = args.format or transfer.detect_format(args.path)
+
+    def reject(number, error):
+        report("Skipped row {0}: {1}".format(number, error))
+
+    with open_file(args.path, "r") as f:
+        try:
+            inserted, skipped = transfer.import_rows(
+                args.table, transfer.read_rows(f, format_), args.batch_size,
+                args.defer_indexes, report if args.progress else None,
+                reject)
+        except transfer.TransferError as e:
+            raise SystemExit(str(e))
+
+    report("Imported {0} {1}, skipped {2}.".format(inserted, args.table,
+                                                   skipped))
+    if skipped:
+        raise SystemExit(1)
+
+
+def export_table(app, args):
+    """Export users or posts to a file of newline delimited JSON or CSV."""
+
+    format_ = args.format or transfer.detect_format(args.path)
+    table = transfer.TABLES[args.table]
+
+    with open_file(args.path, "w") as f:
+        count = transfer.write_rows(f, format_, table.columns,
+                                    transfer.export_rows(
+                                        args.table, args.batch_size,
+                                        report if args.progress else None))
+
+    report("Exported {0} {1}.".format(count, args.table))
+
+
+def backup_database(app, args):
+    """Copy the database to a snapshot while the app is running. Each shard
+    is copied to its own snapshot, named as the shard files are.
+
+    """
+
+    def progress(remaining, total):
+        report("Copied {0} of {1} pages.".format(total - remaining, total))
+
+    destination = args.destination
+    if os.path.isdir(destination):
+        destination = backup.snapshot_path(destination)
+
+    for shard in db.shards:
+        try:
+            path = backup.backup(shard.path,
+                                 sharding.shard_path(destination, shard.index),
+                                 args.pages, args.pace,
+                                 progress if args.progress else None)
+        except backup.BackupError as e:
+            raise SystemExit(str(e))
+
+        report("Backed up the database to {0}.".format(path))
+
+
+def delete_user(app, args):
+    """Delete a user and their posts, the posts in chunks of short
+    transactions so that other writers are not blocked for long.
+
+    """
+
+    def progress(deleted):
+        report("Deleted {0} posts.".format(deleted))
+
+    users, posts = purge.delete_user(args.user_id, args.chunk_size,
+                                     args.pace,
+                                     progress if args.progress else None)
+
+    if not users:
+        raise SystemExit("No user was found.")
+
+    report("Deleted user {0} and {1} posts.".format(args.user_id, posts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the posts database.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    schema = commands.add_parser("create-schema", help=create_schema.__doc__)
+    schema.set_defaults(func=create_schema)
+
+    rebuild = commands.add_parser("rebuild-search",
+                                  help=rebuild_search.__doc__)
+    rebuild.set_defaults(func=rebuild_search)
+
+    for name, func in (("import", import_table), ("export", export_table)):
+        command = commands.add_parser(name, help=func.__doc__)
+        command.add_argument("table", choices=sorted(transfer.TABLES))
+        command.add_argument("path", help='the file, or "-" for standard '
+                                          '{0}'.format("input" if name ==
+                                                       "import" else "output"))
+        command.add_argument("--format", choices=transfer.FORMATS,
+                             help="defaults to csv for .csv files and ndjson "
+                                  "otherwise")
+        command.add_argument("--batch-size", type=positive_int,
+                             default=10000,
+                             help="the number of rows per transaction or "
+                                  "fetch")
+        command.add_argument("--progress", action="store_true",
+                             help="report progress after each batch")
+        command.set_defaults(func=func)
+
+        if name == "import":
+            command.add_argument("--defer-indexes", action="store_true",
+                                 help="rebuild indexes once the rows are "
+                                      "imported rather than as each is")
+
+    snapshot = commands.add_parser("backup", help=backup_database.__doc__)
+    snapshot.add_argument("destination",
+                          help="the snapshot file, or a directory to create "
+                               "one named after the current time in")
+    snapshot.add_argument("--pages", type=positive_int, default=100,
+                          help="the number of pages copied in each step")
+    snapshot.add_argument("--pace", type=float, default=0.01,
+                          help="the number of seconds to wait between steps")
+    snapshot.add_argument("--progress", action="store_true",
+                          help="report progress after each step")
+    snapshot.set_defaults(func=backup_database)
+
+    delete = commands.add_parser("delete-user", help=delete_user.__doc__)
+    delete.add_argument("user_id", type=int)
+    delete.add_argument("--chunk-size", type=positive_int, default=1000,
+                        help="the number of posts deleted per transaction")
+    delete.add_argument("--pace", type=float, default=0.0,
+                        help="the number of seconds to wait between chunks")
+    delete.add_argument("--progress", action="store_true",
+                        help="report progress after each chunk")
+    delete.set_defaults(func=delete_user)
+
+    args = parser.parse_args()
+    args.func(create_app(), args)
+
+
+if __name__ == "__main__":
+    main()
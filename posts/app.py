@@ -1,26 +1,101 @@
 """Logic related to creation and configuration of app instances."""
 
-from flask import Flask, url_for
+from flask import Flask, abort, url_for
 from flask.json import jsonify
 
-from . import db, views
+from . import compression, db, metrics, timing, views
+from .cache import LRUCache
 from .config import Config
 
 
-def create_app():
-    """Create a new instance of the app and configure it."""
+def create_app(config=None):
+    """Create a new instance of the app and configure it. The database is not
+    connected to until it is first used, and its schema is only created if
+    DATABASE_CREATE_SCHEMA is set. Takes one argument:
+
+    - config: a dictionary of settings which override those of Config.
+
+    """
 
     app = Flask("posts")
     app.config.from_object(Config)
+    app.config.update(config or {})
+    app.teardown_appcontext(db.teardown)
+    app.before_request(metrics.before_request)
+    app.after_request(metrics.after_request)
+    app.before_request(timing.before_request)
+    app.after_request(timing.after_request)
+    # Registered last so that it runs first, and the time taken is counted.
+    app.after_request(compression.after_request)
+    init_metrics(app)
     init_db(app)
+    init_cache(app)
     add_routes(app)
     return app
 
 
 def init_db(app):
-    """Initialise the database engine"""
+    """Initialise the database engines, and create the schema if
+    DATABASE_CREATE_SCHEMA is set.
+
+    """
+
+    pragmas = dict(app.config["SQLITE_PRESETS"][app.config["SQLITE_PRESET"]])
+    pragmas.update(app.config["SQLITE_PRAGMAS"])
+
+    audit_tables = None
+    if app.config["QUERY_PLAN_AUDIT"]:
+        audit_tables = app.config["QUERY_PLAN_AUDIT_TABLES"]
+
+    write_batch_size = None
+    if app.config["WRITE_COORDINATOR"]:
+        write_batch_size = app.config["WRITE_BATCH_SIZE"]
+
+    db.init(app.config["DATABASE_PATH"], pragmas,
+            pool_size=app.config["DATABASE_POOL_SIZE"],
+            max_overflow=app.config["DATABASE_POOL_MAX_OVERFLOW"],
+            pool_timeout=app.config["DATABASE_POOL_TIMEOUT"],
+            pool_wait_warning=app.config["DATABASE_POOL_WAIT_WARNING"],
+            audit_tables=audit_tables,
+            write_batch_size=write_batch_size,
+            write_max_wait=app.config["WRITE_MAX_WAIT"],
+            write_pool_size=app.config["DATABASE_WRITE_POOL_SIZE"],
+            write_max_overflow=app.config["DATABASE_WRITE_POOL_MAX_OVERFLOW"],
+            shard_count=app.config["DATABASE_SHARDS"])
+
+    if "metrics" in app.extensions:
+        for engine in db.engines():
+            app.extensions["metrics"].install(engine)
+
+    if app.config["DATABASE_CREATE_SCHEMA"]:
+        db.create_schema()
+
+    # The settings in effect are served at /api/_sqlite.
+    app.logger.info("Configured SQLite settings: %s", pragmas)
+
+
+def init_metrics(app):
+    """Start recording request and database metrics, if they are enabled.
+    The recorder is installed on the database engines by init_db.
 
-    db.init(app.config["DATABASE_PATH"])
+    """
+
+    if app.config["METRICS_ENABLED"]:
+        app.extensions["metrics"] = metrics.Metrics()
+    else:
+        app.extensions.pop("metrics", None)
+
+
+def init_cache(app):
+    """Create the response cache, if it is enabled."""
+
+    if app.config["RESPONSE_CACHE_ENABLED"]:
+        app.extensions["response_cache"] = LRUCache(
+            app.config["RESPONSE_CACHE_MAX_ENTRIES"],
+            app.config["RESPONSE_CACHE_MAX_BYTES"],
+            app.config["RESPONSE_CACHE_TTL"])
+    else:
+        app.extensions.pop("response_cache", None)
 
 
 def add_routes(app):
@@ -34,6 +109,39 @@ def add_routes(app):
     def api_root():
         return jsonify({"links": {"user": url_for("users.list")}})
 
+    @app.route("/api/_cache")
+    def cache_stats():
+        cache = app.extensions.get("response_cache")
+        if cache is None:
+            abort(404)
+
+        return jsonify(cache.stats())
+
+    @app.route("/api/_sqlite")
+    def sqlite_settings():
+        # Read from a connection when asked for, rather than when the app
+        # starts, so that the settings in effect are shown.
+        return jsonify(db.read_pragmas())
+
+    @app.route("/api/_metrics")
+    def metrics_text():
+        recorder = app.extensions.get("metrics")
+        if recorder is None:
+            abort(404)
+
+        gauges = [("posts_db_pool_" + name, "Connection pool " +
+                   name.replace("_", " ") + ".", value)
+                  for name, value in sorted(db.pool_status().items())]
+
+        cache = app.extensions.get("response_cache")
+        if cache is not None:
+            gauges += [("posts_response_cache_" + name, "Response cache " +
+                        name.replace("_", " ") + ".", value)
+                       for name, value in sorted(cache.stats().items())]
+
+        return recorder.render(gauges), 200, {
+            "Content-Type": metrics.CONTENT_TYPE}
+
     # Remove the default HTML.
     @app.errorhandler(404)
     def handle401(e):
@@ -49,6 +157,5 @@ def add_routes(app):
 
     views.user.register(app, "/api/user", "users")
     views.post.register(app, "/api/user/<int:user_id>/post", "posts")
+    views.post.register_search(app, "/api/post/search", "posts.search")
 
-
-app = create_app()
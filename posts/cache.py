@@ -0,0 +1,186 @@
+"""An in-process, bounded LRU cache with expiry and tag based invalidation."""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry(object):
+    __slots__ = ("value", "size", "tags", "expires")
+
+    def __init__(self, value, size, tags, expires):
+        self.value = value
+        self.size = size
+        self.tags = tags
+        self.expires = expires
+
+
+class _Flight(object):
+    """A load of a missing key which other threads can wait for."""
+
+    def __init__(self, started):
+        self.started = started
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LRUCache(object):
+    """A thread-safe cache which evicts the least recently used entries once it
+    holds more than max_entries entries or max_bytes bytes. Entries expire ttl
+    seconds after they were loaded.
+
+    Each entry is labelled with tags, and invalidating a tag removes every
+    entry labelled with it. Concurrent misses for the same key are collapsed
+    into a single load.
+
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.size = 0
+
+        # Loads in progress, and the tags invalidated while they have been.
+        self.flights = {}
+        self.generation = 0
+        self.invalidated = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.evictions = 0
+
+    def get(self, key, tags, loader):
+        """Return the value for a key, loading it if it is not in the cache.
+        Takes three arguments:
+
+        - key: a hashable key identifying the value.
+        - tags: the tags with which the value will be labelled.
+        - loader: a function which takes no arguments and returns a tuple of
+                  the value and its size in bytes. If the size is None then the
+                  value is returned but not cached.
+
+        """
+
+        leader = False
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None:
+                if entry.expires > time.time():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+
+                self._remove(key)
+
+            flight = self.flights.get(key)
+
+            if flight is not None:
+                self.collapsed += 1
+            else:
+                self.misses += 1
+                flight = self.flights[key] = _Flight(self.generation)
+                leader = True
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        value = size = None
+
+        try:
+            value, size = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+
+                if size is not None and \
+                        not self._invalidated_since(tags, flight.started):
+                    self._store(key, tags, value, size)
+
+                if not self.flights:
+                    self.invalidated.clear()
+
+            flight.value = value
+            flight.event.set()
+
+        return value
+
+    def invalidate(self, tag):
+        """Remove every entry labelled with a tag."""
+
+        with self.lock:
+            for key in self.tags.pop(tag, ()):
+                self._remove(key)
+
+            # Loads which are in progress may have read the old data, so they
+            # must not store it.
+            if self.flights:
+                self.generation += 1
+                self.invalidated[tag] = self.generation
+
+    def clear(self):
+        """Remove every entry."""
+
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return a dictionary of statistics describing the cache."""
+
+        with self.lock:
+            return {"entries": len(self.entries),
+                    "bytes": self.size,
+                    "max_entries": self.max_entries,
+                    "max_bytes": self.max_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "collapsed": self.collapsed,
+                    "evictions": self.evictions}
+
+    def _invalidated_since(self, tags, generation):
+        return any(self.invalidated.get(t, 0) > generation for t in tags)
+
+    def _store(self, key, tags, value, size):
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self._remove(key)
+
+        while self.entries and (len(self.entries) >= self.max_entries or
+                                self.size + size > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+        self.entries[key] = _Entry(value, size, tags, time.time() + self.ttl)
+        self.size += size
+
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+
+        for tag in entry.tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
@@ -0,0 +1,86 @@
+"""Compression of responses with gzip or deflate, negotiated with the client's
+Accept-Encoding header.
+
+Responses of at least COMPRESSION_MIN_SIZE bytes are compressed as a whole,
+and streamed responses, whose size is not known in advance, are compressed as
+they are streamed. A compressed response's ETag is made weak, as its bytes
+differ from those of the uncompressed response with the same ETag.
+
+"""
+
+import zlib
+
+from flask import current_app, request
+
+from .timing import timed
+
+# The codings which may be used, in order of preference, and the window bits
+# which select each one's format in zlib. Brotli is not in the standard
+# library.
+CODINGS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+# The media types of the responses which are worth compressing.
+MIMETYPES = ("application/json", "text/plain", "text/html")
+
+
+def compress_iter(chunks, compressor):
+    """Iterate over the compressed data of an iterable of chunks. The
+    compressor is flushed after each chunk, so that the client receives each
+    chunk as it is produced rather than once enough output has built up.
+
+    """
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+
+        yield compressor.compress(chunk) + \
+            compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    yield compressor.flush()
+
+
+def after_request(response):
+    """Compress a response with the coding the client prefers, if compression
+    is enabled and the response is large enough.
+
+    """
+
+    config = current_app.config
+    if not config["COMPRESSION_ENABLED"] or \
+            response.mimetype not in MIMETYPES:
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    if response.status_code < 200 or response.status_code in (204, 304) or \
+            response.direct_passthrough or \
+            "Content-Encoding" in response.headers:
+        return response
+
+    coding = request.accept_encodings.best_match(list(CODINGS))
+    if coding is None:
+        return response
+
+    if not response.is_streamed and \
+            len(response.get_data()) < config["COMPRESSION_MIN_SIZE"]:
+        return response
+
+    compressor = zlib.compressobj(config["COMPRESSION_LEVEL"], zlib.DEFLATED,
+                                  CODINGS[coding])
+
+    if response.is_streamed:
+        response.response = compress_iter(response.response, compressor)
+        response.headers.pop("Content-Length", None)
+    else:
+        with timed("compress"):
+            response.set_data(compressor.compress(response.get_data()) +
+                              compressor.flush())
+
+    response.headers["Content-Encoding"] = coding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
@@ -3,3 +3,115 @@
 
 class Config(object):
     DATABASE_PATH = "/tmp/posts.db"
+
+    # The number of database files the users and their posts are divided
+    # between. The first is DATABASE_PATH and the others add their number
+    # before its extension. Each has its own connection pools, so the pool
+    # sizes below apply to each shard. The number of shards can be increased
+    # later, but existing users are not moved to the new shards.
+    DATABASE_SHARDS = 1
+
+    # Whether the database schema is created, if it does not exist, when the
+    # app is created. Otherwise it is created by "python manage.py
+    # create-schema", which keeps starting the app free of database access.
+    DATABASE_CREATE_SCHEMA = False
+
+    # Whether to check the query plan of every statement issued while handling
+    # a request, and fail those which scan the whole of one of the audited
+    # tables. Intended for tests, as it runs each statement's plan first.
+    QUERY_PLAN_AUDIT = False
+    QUERY_PLAN_AUDIT_TABLES = ("users", "posts")
+
+    # The number of read-only database connections kept open, how many more
+    # may be opened under load and how many seconds to wait for a free
+    # connection. Checkouts which wait longer than DATABASE_POOL_WAIT_WARNING
+    # seconds are logged. GET and HEAD requests read through these
+    # connections, and other requests through a separate, smaller pool of
+    # DATABASE_WRITE_POOL_SIZE writing connections, as SQLite allows only one
+    # writer at a time.
+    DATABASE_POOL_SIZE = 5
+    DATABASE_POOL_MAX_OVERFLOW = 10
+    DATABASE_POOL_TIMEOUT = 30
+    DATABASE_POOL_WAIT_WARNING = 0.1
+    DATABASE_WRITE_POOL_SIZE = 2
+    DATABASE_WRITE_POOL_MAX_OVERFLOW = 0
+
+    # Presets of the SQLite settings applied to every new database connection.
+    # Both use WAL so that readers are not blocked by a writer. "throughput"
+    # only syncs to disk at checkpoints, so the most recent commits may be lost
+    # on power failure, and uses larger caches. "durability" syncs every
+    # commit.
+    SQLITE_PRESETS = {
+        "throughput": {
+            "busy_timeout": 5000,
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 268435456,
+            "cache_size": -65536,
+            "temp_store": "MEMORY",
+        },
+        "durability": {
+            "busy_timeout": 5000,
+            "journal_mode": "WAL",
+            "synchronous": "FULL",
+            "mmap_size": 0,
+            "cache_size": -2000,
+            "temp_store": "DEFAULT",
+        },
+    }
+    SQLITE_PRESET = "durability"
+
+    # Individual SQLite settings which override those of the preset.
+    SQLITE_PRAGMAS = {}
+
+    # The default and maximum number of items returned in one page of a list
+    # endpoint.
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+
+    # The number of rows fetched and encoded at a time when a list is streamed.
+    STREAM_CHUNK_SIZE = 1000
+
+    # An in-process cache of responses for single users and posts, bounded by
+    # a number of entries and a total size in bytes. Entries are invalidated
+    # by writes made through the same process, and otherwise expire after
+    # RESPONSE_CACHE_TTL seconds.
+    RESPONSE_CACHE_ENABLED = False
+    RESPONSE_CACHE_MAX_ENTRIES = 10000
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    RESPONSE_CACHE_TTL = 60
+
+    # Whether request and SQL statement counts and latencies are recorded and
+    # served in the Prometheus text format at /api/_metrics.
+    METRICS_ENABLED = False
+
+    # Whether responses carry a Server-Timing header breaking the time taken
+    # down into parsing, database, serialisation and rendering phases, and the
+    # fraction of requests whose timings are also logged.
+    SERVER_TIMING_ENABLED = False
+    SERVER_TIMING_LOG_SAMPLE_RATE = 0.0
+
+    # Whether single creates, updates and deletes from concurrent requests are
+    # grouped into shared transactions of up to WRITE_BATCH_SIZE writes. A
+    # write waits up to WRITE_MAX_WAIT seconds for others to join it, adding
+    # that much latency in exchange for fewer commits.
+    WRITE_COORDINATOR = False
+    WRITE_BATCH_SIZE = 100
+    WRITE_MAX_WAIT = 0.002
+
+    # When a user is deleted with ?chunked=true, their posts are deleted
+    # USER_DELETE_CHUNK_SIZE at a time, each chunk in its own transaction,
+    # pausing USER_DELETE_PACE seconds between chunks for other writers.
+    USER_DELETE_CHUNK_SIZE = 1000
+    USER_DELETE_PACE = 0.0
+
+    # Whether responses are compressed with gzip or deflate for clients which
+    # accept it. Responses smaller than COMPRESSION_MIN_SIZE bytes are not,
+    # as the saving is too small, while streamed responses always are.
+    # COMPRESSION_LEVEL ranges from 1, the fastest, to 9, the smallest.
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_LEVEL = 1
+
+    # The maximum number of items accepted by a bulk create endpoint.
+    MAX_BULK_ITEMS = 10000
@@ -1,14 +1,51 @@
 """Database-related objects and logic."""
 
+import re
+import sqlite3
 from contextlib import contextmanager
+from functools import partial
+from urllib.parse import quote
 
-from sqlalchemy import create_engine, event
+from flask import has_request_context, request
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.schema import CreateColumn
 
 from ..models.base import Base
+from ..timing import timed
+from . import audit, pool, search, sharding, writer
 
-Session = sessionmaker()
+# The SQLite settings which may be configured, in the order they are applied.
+# The busy timeout comes first so that changing the journal mode waits for
+# other connections rather than failing immediately.
+PRAGMAS = ("busy_timeout", "journal_mode", "synchronous", "mmap_size",
+           "cache_size", "temp_store")
+
+# Sessions are kept in a thread-local registry. Within a request, every call to
+# get_session for a shard uses the same session, which is closed when the
+# request ends. Instances remain usable once their session has been committed
+# and closed. Session is bound to the engine which writes to the database, and
+# ReadSession to one whose connections can only read from it. These are those
+# of the first shard, which is the only one unless the database is sharded.
+Session = scoped_session(sessionmaker(expire_on_commit=False))
+ReadSession = scoped_session(sessionmaker(expire_on_commit=False))
+engine = None
+read_engine = None
+
+# The shards of the database, in order of their ranges of IDs.
+shards = []
+
+# The request methods which are served by read-only sessions.
+READ_METHODS = ("GET", "HEAD")
+
+# The coordinator which groups writes to the first shard into shared
+# transactions, if enabled.
+write_coordinator = None
+
+# Whether posts can be searched, which depends on SQLite supporting FTS5, or
+# None until it has been checked.
+_search_enabled = None
 
 
 @event.listens_for(Engine, "connect")
@@ -23,21 +60,434 @@ def sqlite_enable_foreign_key_constraints(dbapi_connection, connection_record):
     cursor.close()
 
 
-def init(database_path):
-    engine = create_engine("sqlite:///{0}".format(database_path))
-    Base.metadata.create_all(bind=engine)
-    Session.configure(bind=engine)
+def sqlite_pragmas(pragmas):
+    """Return a connect event listener which applies SQLite settings to each
+    new connection. Takes one argument:
+
+    - pragmas: a dictionary mapping the names of settings in PRAGMAS to their
+               values.
+
+    """
+
+    unknown = set(pragmas) - set(PRAGMAS)
+    if unknown:
+        raise ValueError("Unknown SQLite settings: {0}"
+                         .format(", ".join(sorted(unknown))))
+
+    statements = []
+
+    for name in PRAGMAS:
+        if name not in pragmas:
+            continue
+
+        value = str(pragmas[name])
+        if not re.match(r"^-?\w+$", value):
+            raise ValueError("Invalid value for SQLite setting '{0}': {1}"
+                             .format(name, value))
+
+        statements.append("PRAGMA {0}={1}".format(name, value))
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    return apply_pragmas
+
+
+def read_only_connector(database_path):
+    """Return a function which opens a connection to a SQLite database which
+    can only read from it.
+
+    """
+
+    uri = "file:{0}?mode=ro".format(quote(database_path))
+
+    def connect():
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        connection.execute("PRAGMA query_only=ON")
+        return connection
+
+    return connect
+
+
+def init(database_path, pragmas=None, pool_size=5, max_overflow=10,
+         pool_timeout=30, pool_wait_warning=None, audit_tables=None,
+         write_batch_size=None, write_max_wait=0.0, write_pool_size=2,
+         write_max_overflow=0, shard_count=1):
+    """Create the database engines, without connecting to the database. Takes
+    the following arguments:
+
+    - database_path: the path to the SQLite database file, or of the first
+                     shard's file if the database is sharded.
+    - pragmas: a dictionary of SQLite settings applied to each connection.
+    - pool_size: the number of read-only connections kept open in the pool.
+    - max_overflow: the number of read-only connections which may be opened
+                    in addition to pool_size under load.
+    - pool_timeout: the number of seconds to wait for a connection before
+                    giving up.
+    - pool_wait_warning: the number of seconds a checkout may wait for a
+                         connection before a warning is logged, or None.
+    - audit_tables: if not None, the names of tables which statements issued
+                    during requests must not scan.
+    - write_batch_size: if not None, writes made through write are grouped
+                        into transactions of up to this many writes.
+    - write_max_wait: the number of seconds a write waits for others to join
+                      its transaction.
+    - write_pool_size: the number of writing connections kept open. SQLite
+                       only allows one writer at a time, so few are needed.
+    - write_max_overflow: the number of writing connections which may be
+                          opened in addition to write_pool_size.
+    - shard_count: the number of shards the users and their posts are divided
+                   between, each with its own file, engines and pools.
+
+    """
+
+    global engine, read_engine, write_coordinator, _search_enabled
+
+    dispose()
+
+    pool.stats.reset()
+    pool.stats.wait_warning = pool_wait_warning
+
+    pragmas = pragmas or {}
+    _search_enabled = None
+
+    auditor = None
+    if audit_tables is not None:
+        auditor = audit.QueryPlanAuditor(audit_tables)
+
+    shards[:] = [sharding.Shard(0, database_path, Session, ReadSession)]
+    shards.extend(sharding.Shard(i, sharding.shard_path(database_path, i))
+                  for i in range(1, shard_count))
+
+    for shard in shards:
+        open_shard(shard, pragmas, pool_size, max_overflow, pool_timeout,
+                   write_pool_size, write_max_overflow)
+
+        if auditor is not None:
+            for e in shard.engines():
+                auditor.install(e)
+
+        if write_batch_size is not None:
+            shard.write_coordinator = writer.WriteCoordinator(
+                partial(get_session, shard=shard.index), write_batch_size,
+                write_max_wait)
+
+    engine = shards[0].engine
+    read_engine = shards[0].read_engine
+    write_coordinator = shards[0].write_coordinator
+
+
+def open_shard(shard, pragmas, pool_size, max_overflow, pool_timeout,
+               write_pool_size, write_max_overflow):
+    """Create the engines of a shard and bind its sessions to them."""
+
+    # Connections are shared between the threads serving requests, but never
+    # used by two threads at once.
+    engine = create_engine("sqlite:///{0}".format(shard.path),
+                           poolclass=pool.MonitoredQueuePool,
+                           pool_size=write_pool_size,
+                           max_overflow=write_max_overflow,
+                           pool_timeout=pool_timeout,
+                           connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", sqlite_pragmas(pragmas))
+
+    # The journal mode is a property of the database file, which read-only
+    # connections cannot change.
+    read_engine = create_engine("sqlite://",
+                                creator=read_only_connector(shard.path),
+                                poolclass=pool.MonitoredQueuePool,
+                                pool_size=pool_size, max_overflow=max_overflow,
+                                pool_timeout=pool_timeout)
+    event.listen(read_engine, "connect", sqlite_pragmas(
+        {k: v for k, v in pragmas.items() if k != "journal_mode"}))
+
+    shard.engine = engine
+    shard.read_engine = read_engine
+    shard.Session.configure(bind=engine)
+    shard.ReadSession.configure(bind=read_engine)
+
+
+def create_schema():
+    """Create any tables, columns, indexes and the search index which are
+    missing from each shard, and start the shard's ID sequences at its
+    range.
+
+    """
+
+    global _search_enabled
+
+    for shard in shards:
+        Base.metadata.create_all(bind=shard.engine)
+        create_columns(shard.engine)
+        create_indexes(shard.engine)
+
+        with shard.engine.begin() as connection:
+            _search_enabled = search.create(connection)
+            sharding.seed_sequences(connection, shard.index, [
+                t.name for t in Base.metadata.sorted_tables])
+
+
+def search_enabled():
+    """Return whether posts can be searched, which depends on SQLite
+    supporting FTS5. The database is checked for the search index the first
+    time this is called.
+
+    """
+
+    global _search_enabled
+
+    if _search_enabled is None:
+        with engine.connect() as connection:
+            _search_enabled = search.exists(connection)
+
+    return _search_enabled
+
+
+def engines():
+    """Return the engines which are in use, those of each shard in turn with
+    the writing engine first.
+
+    """
+
+    return [e for shard in shards for e in shard.engines()]
+
+
+def shard_count():
+    return len(shards)
+
+
+def shard_for_id(id_):
+    """Return the index of the shard which holds the user or post with an
+    ID.
+
+    """
+
+    return sharding.shard_for_id(id_, len(shards))
+
+
+def shard_for_email(email):
+    """Return the index of the shard a new user with an email is created
+    on.
+
+    """
+
+    return sharding.shard_for_email(email, len(shards))
+
+
+def route():
+    """Return the index of the shard used by default: the only one if the
+    database is not sharded, or otherwise the one holding the user whose ID
+    is in the URL of the current request. Raises a RuntimeError if there is
+    no such user ID.
+
+    """
+
+    if len(shards) == 1:
+        return 0
+
+    user_id = None
+    if has_request_context() and request.view_args:
+        user_id = request.view_args.get("user_id")
+
+    if user_id is None:
+        raise RuntimeError("A shard must be chosen for a request without a "
+                           "user ID.")
+
+    return shard_for_id(user_id)
+
+
+def create_columns(engine):
+    """Add any columns which are missing from existing tables, such as the
+    version column to databases created before it, which create_all does not
+    do. Existing rows take the column's server default.
+
+    """
+
+    inspector = inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+
+        for column in table.columns:
+            if column.name not in existing:
+                engine.execute("ALTER TABLE {0} ADD COLUMN {1}".format(
+                    table.name, CreateColumn(column).compile(
+                        dialect=engine.dialect)))
+
+
+def create_indexes(engine):
+    """Create any indexes which are missing from existing tables, which
+    create_all does not do.
+
+    """
+
+    inspector = inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+
+
+def rebuild_search():
+    """Rebuild the search index of each shard from the contents of its posts
+    table.
+
+    """
+
+    for shard in shards:
+        with shard.engine.begin() as connection:
+            search.rebuild(connection)
+
+
+def dispose():
+    """Stop the write coordinators and close any connections held by the
+    current engines.
+
+    """
+
+    global write_coordinator
+
+    for shard in shards:
+        if shard.write_coordinator is not None:
+            shard.write_coordinator.stop()
+            shard.write_coordinator = None
+
+        shard.Session.remove()
+        shard.ReadSession.remove()
+
+        for e in shard.engines():
+            e.dispose()
+
+    write_coordinator = None
+
+
+def teardown(exception=None):
+    """Close the sessions used during a request, and report any connections
+    which are still checked out afterwards.
+
+    """
+
+    for shard in shards:
+        shard.Session.remove()
+        shard.ReadSession.remove()
+
+    pool.stats.check_leaks()
+
+
+def pool_status():
+    """Return a dictionary describing the usage of the connection pools."""
+
+    status = pool.stats.as_dict()
+
+    if shards:
+        status["size"] = sum(e.pool.size() for e in engines())
+        status["overflow"] = sum(e.pool.overflow() for e in engines())
+
+    return status
+
+
+def read_pragmas():
+    """Return the SQLite settings in effect on a connection from the current
+    engine, as a dictionary.
+
+    """
+
+    with engine.connect() as connection:
+        return {name: connection.execute("PRAGMA {0}".format(name)).scalar()
+                for name in PRAGMAS}
 
 
 @contextmanager
-def get_session():
-    """Provide a context manager to assist with managing database sessions."""
+def get_session(read_only=None, shard=None):
+    """Provide a context manager to assist with managing database sessions.
+    Outside of a request the session is closed on exit, otherwise it is
+    closed by teardown at the end of the request. The time spent within the
+    block is counted as the db phase of the request. Takes two arguments:
 
-    s = Session()
+    - read_only: whether to use a session which can only read. By default,
+                 requests with a method in READ_METHODS read and all others
+                 write.
+    - shard: the index of the shard to use, which defaults to the one chosen
+             by route.
+
+    """
+
+    if read_only is None:
+        read_only = has_request_context() and request.method in READ_METHODS
+
+    if shard is None:
+        shard = route()
+
+    registry = shards[shard].ReadSession if read_only else \
+        shards[shard].Session
+    s = registry()
 
     try:
-        yield s
-        s.commit()
+        with timed("db"):
+            yield s
+            s.commit()
     except:
         s.rollback()
         raise
+    finally:
+        if not has_request_context():
+            registry.remove()
+
+
+def gather(read, indexes=None):
+    """Run a read on a read-only session of each of a number of shards in
+    turn, and return a list of the results in the same order. Takes two
+    arguments:
+
+    - read: a function which takes a session and returns a result which can
+            be used once the session is closed.
+    - indexes: the indexes of the shards to read from, or None for all of
+               them.
+
+    """
+
+    if indexes is None:
+        indexes = range(len(shards))
+
+    results = []
+
+    for index in indexes:
+        with get_session(read_only=True, shard=index) as DB:
+            results.append(read(DB))
+
+    return results
+
+
+def write(operation, shard=None):
+    """Run a write operation and return its result. Takes two arguments:
+
+    - operation: a function which takes a session, makes its changes and
+                 returns a result which can be used once the session is
+                 closed. It may be run more than once, so it must not have
+                 any other side effects.
+    - shard: the index of the shard to write to, which defaults to the one
+             chosen by route.
+
+    If the write coordinator is enabled the operation shares a transaction
+    with those of other requests to the same shard, otherwise it runs in its
+    own.
+
+    """
+
+    if shard is None:
+        shard = route()
+
+    coordinator = shards[shard].write_coordinator
+
+    if coordinator is None:
+        with get_session(shard=shard) as DB:
+            return operation(DB)
+
+    with timed("db"):
+        return coordinator.submit(operation)
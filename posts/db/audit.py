@@ -0,0 +1,60 @@
+"""An audit of the query plans of the statements issued while handling
+requests, which catches missing indexes before they reach production.
+
+"""
+
+import re
+
+from flask import has_request_context
+from sqlalchemy import event
+
+# Matches the query plan steps which read every row of a table, or every
+# entry of one of its indexes, such as "SCAN posts" or "SCAN TABLE posts USING
+# COVERING INDEX ix_posts_user_id_id" depending on the SQLite version.
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?! VIRTUAL TABLE)")
+
+
+class QueryPlanError(Exception):
+    """Raised when a statement would scan the whole of an audited table."""
+
+
+class QueryPlanAuditor(object):
+    """Runs EXPLAIN QUERY PLAN for every statement an engine executes while
+    handling a request, and raises a QueryPlanError if the statement scans
+    one of the audited tables.
+
+    """
+
+    def __init__(self, tables):
+        self.tables = frozenset(tables)
+
+    def install(self, engine):
+        """Audit the statements executed by an engine."""
+
+        event.listen(engine, "before_cursor_execute", self.check)
+
+    def check(self, conn, cursor, statement, parameters, context,
+              executemany):
+        if executemany or not has_request_context():
+            return
+
+        if not statement.lstrip()[:6].upper() in ("SELECT", "UPDATE",
+                                                  "DELETE"):
+            return
+
+        plan_cursor = conn.connection.cursor()
+        try:
+            plan = plan_cursor.execute("EXPLAIN QUERY PLAN " + statement,
+                                       parameters).fetchall()
+        finally:
+            plan_cursor.close()
+
+        for row in plan:
+            detail = row[-1]
+            match = SCAN.match(detail)
+
+            if match and match.group(1) in self.tables:
+                raise QueryPlanError(
+                    "Statement scans {0}: {1}\nPlan:\n{2}".format(
+                        match.group(1), statement,
+                        "\n".join(r[-1] for r in plan)))
@@ -0,0 +1,89 @@
+"""Online backups of the database using SQLite's backup API.
+
+The database is copied a number of pages at a time. Locks are only held while
+a step runs, so the app keeps serving requests, including writes, between the
+steps. If the database is written to by another connection during the backup,
+SQLite restarts the copy, so a backup of a busy database should use larger
+steps or less pacing in order to finish.
+
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+
+class BackupError(Exception):
+    """Raised when a backup fails its integrity check."""
+
+
+def snapshot_path(directory):
+    """Return a path for a new snapshot in a directory, named after the
+    current time.
+
+    """
+
+    return os.path.join(directory, "posts-{0}.db".format(
+        datetime.utcnow().strftime("%Y%m%d-%H%M%S")))
+
+
+def backup(database_path, destination, pages=100, pace=0.01, progress=None):
+    """Copy a database to a snapshot file, check the integrity of the copy and
+    return its path. The snapshot is written to a temporary file which is only
+    renamed to the destination once it has been checked. Takes the following
+    arguments:
+
+    - database_path: the path to the SQLite database file.
+    - destination: the path of the snapshot, or a directory to create a
+                   snapshot named after the current time in.
+    - pages: the number of pages copied in each step.
+    - pace: the number of seconds to wait between steps, during which other
+            connections may use the database.
+    - progress: a function called after each step with the number of pages
+                remaining and the total number of pages.
+
+    Raises a BackupError if the copy fails its integrity check.
+
+    """
+
+    if os.path.isdir(destination):
+        destination = snapshot_path(destination)
+
+    partial = destination + ".partial"
+    if os.path.exists(partial):
+        os.unlink(partial)
+
+    def step(status, remaining, total):
+        if progress is not None:
+            progress(remaining, total)
+        if remaining and pace:
+            time.sleep(pace)
+
+    source = sqlite3.connect("file:{0}?mode=ro".format(quote(database_path)),
+                             uri=True)
+    target = sqlite3.connect(partial)
+
+    try:
+        source.backup(target, pages=pages, progress=step)
+
+        # The copy is in the journal mode of the database, and a snapshot
+        # should be a single file.
+        target.execute("PRAGMA journal_mode=DELETE")
+
+        result = target.execute("PRAGMA integrity_check").fetchall()
+        if result != [("ok",)]:
+            raise BackupError("The backup failed its integrity check: {0}"
+                              .format("; ".join(r[0] for r in result)))
+    except BaseException:
+        target.close()
+        os.unlink(partial)
+        raise
+    finally:
+        source.close()
+
+    target.close()
+    os.replace(partial, destination)
+
+    return destination
@@ -0,0 +1,100 @@
+"""A connection pool which reports on how it is used."""
+
+import logging
+import threading
+import time
+
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats(object):
+    """Keep count of checkouts from the connection pool, how long they waited
+    for a connection and which threads hold connections.
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wait_warning = None
+        self.reset()
+
+    def reset(self):
+        """Clear all of the statistics."""
+
+        with self.lock:
+            self.checkouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.leaks = 0
+            self.held = {}
+
+    def checkout(self, record, wait):
+        """Record a checkout of a connection. Takes two arguments:
+
+        - record: the pool's record of the connection.
+        - wait: the time in seconds spent waiting for the connection.
+
+        """
+
+        with self.lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.held[id(record)] = threading.current_thread().ident
+
+        if self.wait_warning is not None and wait > self.wait_warning:
+            logger.warning("Waited %.3fs for a database connection.", wait)
+
+    def checkin(self, record):
+        """Record the return of a connection to the pool."""
+
+        with self.lock:
+            self.held.pop(id(record), None)
+
+    def check_leaks(self):
+        """Report any connections still held by the current thread, which
+        should have none once a request has finished. Returns the number of
+        such connections.
+
+        """
+
+        ident = threading.current_thread().ident
+
+        with self.lock:
+            leaked = sum(1 for i in self.held.values() if i == ident)
+            self.leaks += leaked
+
+        if leaked:
+            logger.warning("%d database connection(s) still checked out at "
+                           "the end of a request.", leaked)
+
+        return leaked
+
+    def as_dict(self):
+        """Return the statistics as a dictionary."""
+
+        with self.lock:
+            return {"checkouts": self.checkouts,
+                    "checked_out": len(self.held),
+                    "wait_total": self.wait_total,
+                    "wait_max": self.wait_max,
+                    "leaks": self.leaks}
+
+
+stats = PoolStats()
+
+
+class MonitoredQueuePool(QueuePool):
+    """A QueuePool which records its usage in stats."""
+
+    def _do_get(self):
+        start = time.time()
+        record = super(MonitoredQueuePool, self)._do_get()
+        stats.checkout(record, time.time() - start)
+        return record
+
+    def _do_return_conn(self, record):
+        stats.checkin(record)
+        super(MonitoredQueuePool, self)._do_return_conn(record)
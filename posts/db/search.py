@@ -0,0 +1,80 @@
+"""The full-text search index over posts, using SQLite's FTS5 extension.
+
+The index is an external content table which stores only the index itself
+and reads the text from the posts table. Triggers on the posts table keep the
+index in sync.
+
+"""
+
+import logging
+
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE posts_fts USING fts5(
+    title, body, content='posts', content_rowid='id'
+)
+"""
+
+CREATE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_update
+    AFTER UPDATE OF title, body ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO posts_fts(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+)
+
+
+def exists(connection):
+    """Return whether the search index exists."""
+
+    return bool(connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'").scalar())
+
+
+def create(connection):
+    """Create the search index and its triggers if they do not exist. An
+    index created for a database which already contains posts is populated
+    from them. Returns False if SQLite was built without FTS5, in which case
+    search is unavailable, or True otherwise.
+
+    """
+
+    if not exists(connection):
+        try:
+            connection.execute(CREATE_TABLE)
+        except OperationalError:
+            logger.warning("SQLite does not support FTS5, so posts cannot be "
+                           "searched.")
+            return False
+
+        rebuild(connection)
+
+    for statement in CREATE_TRIGGERS:
+        connection.execute(statement)
+
+    return True
+
+
+def rebuild(connection):
+    """Rebuild the search index from the contents of the posts table."""
+
+    connection.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
@@ -0,0 +1,102 @@
+"""Horizontal sharding of the database by user.
+
+Each shard is a separate SQLite database file which holds some of the users
+and all of their posts, so every request under /api/user/<user_id> is served
+by a single shard. IDs are allocated from a range per shard: shard n assigns
+IDs above n * 2 ** ID_BITS, by starting the AUTOINCREMENT sequences of its
+tables there. IDs are therefore unique across the shards, the shard holding a
+user can be found from their ID alone, and listing users in order of ID reads
+the shards in order. The first shard is the unsharded database file and its
+range starts at 1, so an existing database can become the first shard.
+
+New users are placed by a hash of their email, so that two users with the
+same email are created on the same shard, where the unique index rejects the
+second.
+
+"""
+
+import os
+import zlib
+
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+# The number of bits of an ID which are allocated within a shard.
+ID_BITS = 40
+
+
+class Shard(object):
+    """The engines, sessions and write coordinator of one database file.
+
+    Takes the following arguments:
+
+    - index: the position of the shard, which determines its range of IDs.
+    - path: the path to its SQLite database file.
+    - Session: the registry of writing sessions, or None to create one.
+    - ReadSession: the registry of read-only sessions, or None to create
+                   one.
+
+    """
+
+    def __init__(self, index, path, Session=None, ReadSession=None):
+        self.index = index
+        self.path = path
+        self.Session = Session or scoped_session(
+            sessionmaker(expire_on_commit=False))
+        self.ReadSession = ReadSession or scoped_session(
+            sessionmaker(expire_on_commit=False))
+        self.engine = None
+        self.read_engine = None
+        self.write_coordinator = None
+
+    def engines(self):
+        return [e for e in (self.engine, self.read_engine) if e is not None]
+
+
+def shard_path(path, index):
+    """Return the path of the database file of a shard. The first shard uses
+    the path itself, and the others add their index before the extension.
+
+    """
+
+    if index == 0:
+        return path
+
+    root, ext = os.path.splitext(path)
+    return "{0}-{1}{2}".format(root, index, ext)
+
+
+def shard_for_id(id_, count):
+    """Return the index of the shard whose range contains an ID. IDs beyond
+    the range of the last shard belong to it, where they are not found.
+
+    """
+
+    return min(max(id_ >> ID_BITS, 0), count - 1)
+
+
+def shard_for_email(email, count):
+    """Return the index of the shard a new user with an email is placed
+    on.
+
+    """
+
+    return zlib.crc32(email.encode("utf-8")) % count
+
+
+def seed_sequences(connection, index, tables):
+    """Start the ID sequences of tables at the start of the range of the
+    shard with an index, unless they are already past it.
+
+    """
+
+    start = index << ID_BITS
+    if not start:
+        return
+
+    for table in tables:
+        connection.execute("UPDATE sqlite_sequence SET seq = ? "
+                           "WHERE name = ? AND seq < ?", start, table, start)
+        connection.execute("INSERT INTO sqlite_sequence (name, seq) "
+                           "SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM "
+                           "sqlite_sequence WHERE name = ?)",
+                           table, start, table)
@@ -0,0 +1,127 @@
+"""Group commit of writes from concurrent requests.
+
+SQLite allows a single writer at a time, and each transaction pays for its own
+commit. The coordinator runs writes submitted by many threads on one thread,
+in batches which share a single transaction and commit.
+
+"""
+
+import queue
+import threading
+import time
+
+
+class _Write(object):
+    """A write waiting for the coordinator, and its outcome."""
+
+    __slots__ = ("operation", "event", "result", "error")
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WriteCoordinator(object):
+    """Runs write operations submitted by other threads in batches of up to
+    batch_size operations. Once a write arrives, the coordinator waits up to
+    max_wait seconds for others to join its batch.
+
+    The operations of a batch run in a single transaction. If any of them
+    fails, the transaction is rolled back and each operation is run again in
+    a transaction of its own, so that each caller receives its own result or
+    error. Operations must therefore be safe to run again after a rollback.
+
+    """
+
+    def __init__(self, get_session, batch_size, max_wait):
+        self.get_session = get_session
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+
+        self.batches = 0
+        self.writes = 0
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="db-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, operation):
+        """Run an operation in the coordinator's thread and return its result,
+        or raise the error it raised. Takes one argument:
+
+        - operation: a function which takes a session, makes its changes and
+                     returns a result which can be used once the session is
+                     closed.
+
+        """
+
+        write = _Write(operation)
+        self.queue.put(write)
+        write.event.wait()
+
+        if write.error is not None:
+            raise write.error
+
+        return write.result
+
+    def stop(self):
+        """Finish the writes already submitted and stop the thread."""
+
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            write = self.queue.get()
+            if write is None:
+                return
+
+            batch = [write]
+            deadline = time.time() + self.max_wait
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+
+                try:
+                    if remaining > 0:
+                        write = self.queue.get(timeout=remaining)
+                    else:
+                        write = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if write is None:
+                    self.execute(batch)
+                    return
+
+                batch.append(write)
+
+            self.execute(batch)
+
+    def execute(self, batch):
+        self.batches += 1
+        self.writes += len(batch)
+
+        if len(batch) > 1:
+            try:
+                with self.get_session() as DB:
+                    results = [w.operation(DB) for w in batch]
+            except Exception:
+                pass  # Find out which of the operations failed.
+            else:
+                for write, result in zip(batch, results):
+                    write.result = result
+                    write.event.set()
+                return
+
+        for write in batch:
+            try:
+                with self.get_session() as DB:
+                    write.result = write.operation(DB)
+            except Exception as e:
+                write.error = e
+
+            write.event.set()
@@ -0,0 +1,229 @@
+"""Counters and latency histograms for requests and SQL statements, exposed
+in the Prometheus text format.
+
+Recording takes one lock and a few arithmetic operations per request and per
+statement, so metrics may be left enabled under full load.
+
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import current_app, g, request
+from sqlalchemy import event
+
+# The upper bounds, in seconds, of the latency histogram buckets.
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                     0.25, 0.5, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram(object):
+    """Counts of observations in buckets of increasing upper bounds, which
+    are not cumulative until rendered.
+
+    """
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        lines = []
+        total = 0
+
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            lines.append("{0}_bucket{1} {2}".format(
+                name, format_labels(labels + (("le", str(bound)),)), total))
+
+        lines.append("{0}_sum{1} {2}".format(name, format_labels(labels),
+                                             self.sum))
+        lines.append("{0}_count{1} {2}".format(name, format_labels(labels),
+                                               total))
+        return lines
+
+
+def format_labels(labels):
+    """Format a tuple of (name, value) pairs as a Prometheus label set."""
+
+    if not labels:
+        return ""
+
+    return "{" + ",".join('{0}="{1}"'.format(
+        name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels) + "}"
+
+
+class Metrics(object):
+    """Records the number, status and duration of requests to each endpoint,
+    and the number, duration and errors of SQL statements of each kind.
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.request_durations = {}
+        self.statements = {}
+        self.statement_errors = {}
+
+    def install(self, engine):
+        """Time the statements executed by an engine."""
+
+        event.listen(engine, "before_cursor_execute", self.before_statement)
+        event.listen(engine, "after_cursor_execute", self.after_statement)
+        event.listen(engine, "handle_error", self.failed_statement)
+
+    def before_statement(self, conn, cursor, statement, parameters, context,
+                         executemany):
+        conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+    def after_statement(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        self.observe_statement(conn, statement)
+
+    def failed_statement(self, context):
+        """Record a statement which raised an error, for which
+        after_cursor_execute is not called.
+
+        """
+
+        if context.connection is not None and context.statement is not None:
+            self.observe_statement(context.connection, context.statement,
+                                   failed=True)
+
+    def observe_statement(self, conn, statement, failed=False):
+        """Record the duration of a statement started on a connection, and
+        count it as an error if it failed.
+
+        """
+
+        starts = conn.info.get("statement_start")
+        if not starts:
+            return
+
+        duration = time.perf_counter() - starts.pop()
+        operation = statement.lstrip().split(None, 1)[0].upper()
+
+        with self.lock:
+            histogram = self.statements.get(operation)
+            if histogram is None:
+                histogram = self.statements[operation] = \
+                    Histogram(STATEMENT_BUCKETS)
+            histogram.observe(duration)
+
+            if failed:
+                self.statement_errors[operation] = \
+                    self.statement_errors.get(operation, 0) + 1
+
+    def observe_request(self, endpoint, method, status, duration):
+        """Record a request which has been handled. Takes four arguments:
+
+        - endpoint: the name of the endpoint which handled the request.
+        - method: the HTTP method of the request.
+        - status: the status code of the response.
+        - duration: the time in seconds taken to produce the response.
+
+        """
+
+        key = (endpoint, method)
+
+        with self.lock:
+            status_key = key + (status,)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+            histogram = self.request_durations.get(key)
+            if histogram is None:
+                histogram = self.request_durations[key] = \
+                    Histogram(REQUEST_BUCKETS)
+            histogram.observe(duration)
+
+    def render(self, gauges=()):
+        """Return the metrics in the Prometheus text format. Takes one
+        argument:
+
+        - gauges: a list of (name, help, value) tuples of further values to
+                  include.
+
+        """
+
+        with self.lock:
+            requests = sorted(self.requests.items())
+            durations = [(k, self.request_durations[k].render(
+                "posts_http_request_duration_seconds",
+                (("endpoint", k[0]), ("method", k[1]))))
+                for k in sorted(self.request_durations)]
+            statements = [(k, self.statements[k].render(
+                "posts_sql_statement_duration_seconds",
+                (("operation", k),)))
+                for k in sorted(self.statements)]
+            errors = sorted(self.statement_errors.items())
+
+        lines = ["# HELP posts_http_requests_total Requests handled.",
+                 "# TYPE posts_http_requests_total counter"]
+        for (endpoint, method, status), count in requests:
+            lines.append("posts_http_requests_total{0} {1}".format(
+                format_labels((("endpoint", endpoint), ("method", method),
+                               ("status", status))), count))
+
+        lines += ["# HELP posts_http_request_duration_seconds Time taken to "
+                  "produce responses.",
+                  "# TYPE posts_http_request_duration_seconds histogram"]
+        for _, rendered in durations:
+            lines += rendered
+
+        lines += ["# HELP posts_sql_statement_duration_seconds Time taken to "
+                  "execute SQL statements.",
+                  "# TYPE posts_sql_statement_duration_seconds histogram"]
+        for _, rendered in statements:
+            lines += rendered
+
+        lines += ["# HELP posts_sql_statement_errors_total SQL statements "
+                  "which raised an error.",
+                  "# TYPE posts_sql_statement_errors_total counter"]
+        for operation, count in errors:
+            lines.append("posts_sql_statement_errors_total{0} {1}".format(
+                format_labels((("operation", operation),)), count))
+
+        for name, help_, value in gauges:
+            lines += ["# HELP {0} {1}".format(name, help_),
+                      "# TYPE {0} gauge".format(name),
+                      "{0} {1}".format(name, value)]
+
+        return "\n".join(lines) + "\n"
+
+
+def before_request():
+    """Note the time at which a request started, if metrics are enabled."""
+
+    if "metrics" in current_app.extensions:
+        g.request_started = time.perf_counter()
+
+
+def after_request(response):
+    """Record a request which has been handled, if metrics are enabled. The
+    duration of a streamed response only covers the time to its first byte.
+
+    """
+
+    metrics = current_app.extensions.get("metrics")
+    started = g.pop("request_started", None)
+
+    if metrics is not None and started is not None:
+        metrics.observe_request(request.endpoint or "none", request.method,
+                                response.status_code,
+                                time.perf_counter() - started)
+
+    return response
@@ -1,16 +1,142 @@
 """Constructs the Base class used by all models."""
 
+from sqlalchemy import Column, Integer, and_, func, select
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm.exc import NoResultFound
 
-from .errors import ModelError
+from .errors import ModelError, StaleVersionError
 
 
 class BaseModel(object):
+    # Incremented by every update, so that clients can tell whether their copy
+    # of an instance is current.
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    @classmethod
+    def serialized_columns(cls):
+        """Return the columns included in the dictionary representation of the
+        model.
+
+        """
+
+        return [c for c in cls.__table__.columns
+                if not c.foreign_keys and c.key != "version"]
+
     def to_dict(self):
         """Generate a dictionary representation of the model instance."""
 
-        return {c.key: getattr(self, c.key) for c in self.__table__.columns
-                if not c.foreign_keys}
+        return {c.key: getattr(self, c.key) for c in self.serialized_columns()}
+
+    @classmethod
+    def select_fields(cls, fields):
+        """Validate the names of a subset of the fields in the dictionary
+        representation of the model. Returns a tuple of the names in the
+        order of the columns, which always includes the ID. Raises a
+        ModelError if any name is not a field of the model.
+
+        """
+
+        keys = [c.key for c in cls.serialized_columns()]
+
+        for field in fields:
+            if field not in keys:
+                raise ModelError("{0} model does not have a field named "
+                                 "'{1}'".format(cls.__name__, field))
+
+        return tuple(k for k in keys if k == "id" or k in fields)
+
+    @classmethod
+    def reader(cls, fields=None):
+        """Return the columns selected by the read methods, and a function
+        which converts a row of those columns into the same dictionary as
+        to_dict. Takes one argument:
+
+        - fields: a tuple from select_fields to restrict the columns to, or
+                  None for all of them.
+
+        Both are computed once per model and set of fields.
+
+        """
+
+        readers = cls.__dict__.get("_readers")
+        if readers is None:
+            readers = cls._readers = {}
+
+        reader = readers.get(fields)
+
+        if reader is None:
+            columns = [c for c in cls.serialized_columns()
+                       if fields is None or c.key in fields]
+            keys = tuple(c.key for c in columns)
+
+            # Any columns selected after the serialised ones are ignored.
+            def convert(row):
+                return dict(zip(keys, row))
+
+            reader = readers[fields] = (columns, convert)
+
+        return reader
+
+    @classmethod
+    def read(cls, DB, id_, *criterion, fields=None):
+        """Read the instance with an ID of id_ without loading it into the
+        session. Returns its dictionary representation, restricted to fields
+        if given, and its version, or raises NoResultFound. Any further
+        arguments are used to filter the result.
+
+        """
+
+        columns, convert = cls.reader(fields)
+        statement = select(columns + [cls.version]) \
+            .where(and_(cls.id == id_, *criterion))
+
+        row = DB.execute(statement).first()
+        if row is None:
+            raise NoResultFound()
+
+        return convert(row), row[-1]
+
+    @classmethod
+    def read_page(cls, DB, after, limit, *criterion, fields=None):
+        """Read the dictionary representations of up to limit instances, as
+        page does, without loading them into the session. The dictionaries
+        are restricted to fields if given.
+
+        """
+
+        columns, convert = cls.reader(fields)
+        statement = select(columns) \
+            .where(and_(cls.id > after, *criterion)) \
+            .order_by(cls.id).limit(limit)
+
+        return [convert(row) for row in DB.execute(statement)]
+
+    @classmethod
+    def read_iter(cls, DB, after, limit, chunk_size, *criterion, fields=None):
+        """Iterate over the dictionary representations of up to limit
+        instances, or all of them if limit is None, with an ID greater than
+        after in order of ID. Rows are fetched from the database chunk_size at
+        a time. Any further arguments are used to filter the results, and the
+        dictionaries are restricted to fields if given.
+
+        """
+
+        columns, convert = cls.reader(fields)
+        statement = select(columns) \
+            .where(and_(cls.id > after, *criterion)).order_by(cls.id)
+
+        if limit is not None:
+            statement = statement.limit(limit)
+
+        result = DB.execute(statement)
+
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            for row in rows:
+                yield convert(row)
 
     @classmethod
     def get(cls, DB, id_):
@@ -20,6 +146,16 @@ class BaseModel(object):
     def all(cls, DB):
         return DB.query(cls).all()
 
+    @classmethod
+    def page(cls, DB, after, limit, *criterion):
+        """Retrieve up to limit instances with an ID greater than after, in
+        order of ID. Any further arguments are used to filter the results.
+
+        """
+
+        return (DB.query(cls).filter(cls.id > after, *criterion)
+                .order_by(cls.id).limit(limit).all())
+
     @classmethod
     def create(cls, DB, save=True, **kwargs):
         instance = cls(**kwargs)
@@ -29,6 +165,25 @@ class BaseModel(object):
 
         return instance
 
+    @classmethod
+    def bulk_create(cls, DB, rows):
+        """Insert a list of dictionaries of column values as new rows using a
+        single executemany statement. Returns the IDs of the new rows, in the
+        same order as rows.
+
+        """
+
+        if not rows:
+            return []
+
+        DB.execute(cls.__table__.insert(), rows)
+
+        # SQLite assigns each new row the largest ID the table has used plus
+        # one, and the write lock is held for the whole statement, so the new
+        # IDs are the contiguous range ending at the last one inserted.
+        last = DB.execute(select([func.last_insert_rowid()])).scalar()
+        return list(range(last - len(rows) + 1, last + 1))
+
     @classmethod
     def prepare_updates(cls, **kwargs):
         updates = {}
@@ -43,15 +198,58 @@ class BaseModel(object):
         return updates
 
     @classmethod
-    def update(cls, DB, id_, **kwargs):
+    def apply_updates(cls, DB, id_, updates, expected_version=None,
+                      criterion=()):
+        """Apply prepared updates to the instance with an ID of id_ and
+        increment its version. Takes the following arguments:
+
+        - updates: a dictionary of updates from prepare_updates.
+        - expected_version: if not None, the updates are only applied if the
+                            instance is at this version.
+        - criterion: further criteria the instance must match.
+
+        Raises NoResultFound if there is no such instance, or
+        StaleVersionError if it is not at the expected version.
+
+        """
+
+        updates[cls.version] = cls.version + 1
+        query = DB.query(cls).filter(cls.id == id_, *criterion)
+
+        if expected_version is None:
+            matched = query.update(updates)
+        else:
+            matched = query.filter(cls.version == expected_version) \
+                .update(updates)
+
+        if not matched:
+            if expected_version is not None and \
+                    DB.query(query.exists()).scalar():
+                raise StaleVersionError("{0} {1} is not at version {2}."
+                                        .format(cls.__name__, id_,
+                                                expected_version))
+            raise NoResultFound()
+
+    @classmethod
+    def update(cls, DB, id_, expected_version=None, **kwargs):
+        """Update the instance with an ID of id_, as apply_updates does, and
+        return its new dictionary representation and version as read does.
+
+        """
+
         updates = cls.prepare_updates(**kwargs)
-        DB.query(cls).filter(cls.id == id_).update(updates)
+        cls.apply_updates(DB, id_, updates, expected_version)
 
-        return cls.get(DB, id_)
+        return cls.read(DB, id_)
 
     @classmethod
-    def delete(cls, DB, id_):
-        DB.query(cls).filter(cls.id == id_).delete()
+    def delete(cls, DB, id_, *criterion):
+        """Delete the instance with an ID of id_ if it matches any further
+        arguments. Returns the number of instances deleted.
+
+        """
+
+        return DB.query(cls).filter(cls.id == id_, *criterion).delete()
 
     @classmethod
     def exists(cls, DB, id_):
@@ -2,3 +2,7 @@
 
 class ModelError(Exception):
     """Convenience wrapper for exceptions from the models package."""
+
+
+class StaleVersionError(ModelError):
+    """Raised when an instance is not at the version a change expected."""
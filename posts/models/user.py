@@ -1,7 +1,9 @@
 """Define the models for users and their associated posts."""
 
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import (Column, ForeignKey, Index, Integer, String, and_,
+                        select)
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import column, table
 
 from .base import Base
 
@@ -17,12 +19,43 @@ class User(Base):
 
     __tablename__ = "users"
 
+    # IDs come from an AUTOINCREMENT sequence, which each shard of the
+    # database starts at its own range.
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id = Column(Integer, primary_key=True)
     email = Column(String, nullable=False, unique=True)
     name = Column(String, nullable=False)
 
+    # Posts are deleted with their user by the foreign key's ON DELETE
+    # CASCADE, rather than by loading them into the session first.
     posts = relationship("Post", backref="user",
-                         cascade="all, delete")
+                         cascade="all, delete", passive_deletes=True)
+
+    @classmethod
+    def existing_emails(cls, DB, emails):
+        """Return the set of the given emails which already belong to a
+        user.
+
+        """
+
+        emails = list(emails)
+        existing = set()
+
+        # Query in chunks to stay under SQLite's limit on bound parameters.
+        for i in range(0, len(emails), 500):
+            query = DB.query(cls.email).filter(
+                cls.email.in_(emails[i:i + 500]))
+            existing.update(email for email, in query)
+
+        return existing
+
+
+# The full-text search index of posts, which is created by the db package.
+# Its rowid is the ID of the post and the column named after the table is
+# used to match queries.
+post_search = table("posts_fts", column("rowid"), column("rank"),
+                    column("posts_fts"))
 
 
 class Post(Base):
@@ -34,6 +67,13 @@ class Post(Base):
     """
 
     __tablename__ = "posts"
+    __table_args__ = (
+        # Serves listing a user's posts in order of ID, finding a post by its
+        # user and ID, and cascading deletes from users.
+        Index("ix_posts_user_id_id", "user_id", "id"),
+        # Allocates IDs from the range of the shard, as for users.
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
@@ -42,10 +82,79 @@ class Post(Base):
                      nullable=False)
 
     @classmethod
-    def update_for_user(cls, DB, post_id, user_id, **kwargs):
+    def update_for_user(cls, DB, post_id, user_id, expected_version=None,
+                        **kwargs):
+        """Update a post belonging to a user, as apply_updates does, and
+        return its new dictionary representation and version as read does.
+
+        """
+
         updates = cls.prepare_updates(**kwargs)
 
-        DB.query(cls).filter(cls.user_id == user_id,
-                             cls.id == post_id).update(updates)
+        cls.apply_updates(DB, post_id, updates, expected_version,
+                          criterion=[cls.user_id == user_id])
+
+        return cls.read(DB, post_id)
+
+    @classmethod
+    def update_many_for_user(cls, DB, user_id, updates, *criterion):
+        """Apply prepared updates to all of a user's posts which match any
+        further arguments in a single statement, and increment their
+        versions. Returns the number of posts updated.
 
-        return cls.get(DB, post_id)
+        """
+
+        updates = dict(updates)
+        updates[cls.version] = cls.version + 1
+
+        return DB.query(cls).filter(cls.user_id == user_id, *criterion) \
+            .update(updates, synchronize_session=False)
+
+    @classmethod
+    def delete_many_for_user(cls, DB, user_id, *criterion):
+        """Delete all of a user's posts which match any further arguments in
+        a single statement. Returns the number of posts deleted.
+
+        """
+
+        return DB.query(cls).filter(cls.user_id == user_id, *criterion) \
+            .delete(synchronize_session=False)
+
+    @classmethod
+    def delete_for_user(cls, DB, user_id, limit):
+        """Delete up to limit of a user's posts, those with the lowest IDs
+        first. Returns the number of posts deleted.
+
+        """
+
+        ids = select([cls.id]).where(cls.user_id == user_id) \
+            .order_by(cls.id).limit(limit)
+
+        return DB.query(cls).filter(cls.id.in_(ids)) \
+            .delete(synchronize_session=False)
+
+    @classmethod
+    def search(cls, DB, query, offset, limit, *criterion, fields=None,
+               ranked=False):
+        """Read the dictionary representations of up to limit posts matching
+        a full-text search query, skipping the first offset, with the best
+        matches first. Any further arguments are used to filter the results,
+        and the dictionaries are restricted to fields if given. If ranked is
+        True, (rank, dictionary) pairs are returned instead, where a lower
+        rank is a better match, so that the results of searches of several
+        shards can be merged.
+
+        """
+
+        columns, convert = cls.reader(fields)
+        statement = select(columns + [post_search.c.rank]) \
+            .select_from(post_search.join(cls.__table__,
+                                          cls.id == post_search.c.rowid)) \
+            .where(and_(post_search.c.posts_fts.match(query), *criterion)) \
+            .order_by(post_search.c.rank, cls.id) \
+            .limit(limit).offset(offset)
+
+        if ranked:
+            return [(row[-1], convert(row)) for row in DB.execute(statement)]
+
+        return [convert(row) for row in DB.execute(statement)]
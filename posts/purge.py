@@ -0,0 +1,53 @@
+"""Deletion of users whose posts are too many to delete in one statement.
+
+Deleting a user deletes their posts through the foreign key's ON DELETE
+CASCADE, in the same statement. For a user with a very large number of posts
+that statement holds SQLite's write lock for a long time, blocking every other
+writer. Instead, the posts can be deleted a chunk at a time, each in a short
+transaction of its own, before the user is.
+
+"""
+
+import time
+
+from . import db
+from .models import Post, User
+
+
+def delete_user(user_id, chunk_size=1000, pace=0.0, progress=None):
+    """Delete a user's posts in chunks, and then the user. Takes the following
+    arguments:
+
+    - user_id: the ID of the user to delete.
+    - chunk_size: the number of posts deleted in each transaction.
+    - pace: the number of seconds to wait between chunks, during which other
+            writers may take the write lock.
+    - progress: a function called after each chunk with the number of posts
+                deleted so far.
+
+    Returns a tuple of the number of users deleted, which is 0 if there was
+    no such user, and the number of posts deleted.
+
+    """
+
+    deleted = 0
+    shard = db.shard_for_id(user_id)
+
+    while True:
+        count = db.write(lambda DB: Post.delete_for_user(DB, user_id,
+                                                         chunk_size), shard)
+        deleted += count
+
+        if progress is not None:
+            progress(deleted)
+
+        if count < chunk_size:
+            break
+
+        if pace:
+            time.sleep(pace)
+
+    # Any posts created since the last chunk are deleted with the user.
+    users = db.write(lambda DB: User.delete(DB, user_id), shard)
+
+    return users, deleted
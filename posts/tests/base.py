@@ -1,25 +1,66 @@
 
 import os
 import tempfile
+from contextlib import contextmanager
 from unittest import TestCase
 
-from ..app import create_app, init_db
+from sqlalchemy import event
+
+from .. import db
+from ..app import create_app
 
 
 class AppTestCase(TestCase):
     """Contains the common logic for tests."""
 
+    # Settings which the tests of a subclass override.
+    config = {}
+
     def setUp(self):
         """Create an instance of the app in test mode with a test database."""
 
-        self.app = create_app()
-        self.app.testing = True
-        self.db_fd, self.app.config["DATABASE_PATH"] = tempfile.mkstemp()
+        self.db_fd, path = tempfile.mkstemp()
+        self.app = create_app(dict({"TESTING": True,
+                                    "DATABASE_PATH": path,
+                                    "DATABASE_CREATE_SCHEMA": True,
+                                    "QUERY_PLAN_AUDIT": True}, **self.config))
         self.client = self.app.test_client()
-        init_db(self.app)
 
     def tearDown(self):
-        """Delete the test database file."""
+        """Delete the test database files."""
 
+        paths = [shard.path for shard in db.shards]
+        db.dispose()
         os.close(self.db_fd)
-        os.unlink(self.app.config["DATABASE_PATH"])
+
+        for path in paths:
+            for filename in (path, path + "-wal", path + "-shm"):
+                if os.path.exists(filename):
+                    os.unlink(filename)
+
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        """Assert that no more than budget statements are executed against the
+        database within the block.
+
+        """
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engines = db.engines()
+
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", count)
+        try:
+            yield statements
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", count)
+
+        self.assertLessEqual(
+            len(statements), budget,
+            "{0} statements executed, over the budget of {1}:\n{2}".format(
+                len(statements), budget, "\n".join(statements)))
@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import tempfile
+
+from ..db import backup, get_session
+from ..models import Post, User
+
+from .base import AppTestCase
+
+
+class TestBackup(AppTestCase):
+    def setUp(self):
+        super(TestBackup, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for filename in os.listdir(self.directory):
+            os.unlink(os.path.join(self.directory, filename))
+        os.rmdir(self.directory)
+
+        super(TestBackup, self).tearDown()
+
+    def test_backup(self):
+        """Test that the database is copied a few pages at a time to a
+        snapshot which contains all of its rows.
+
+        """
+
+        user = User(name="Jill", email="jill@test.com")
+        posts = [Post(title="Post {0}".format(i), body="x" * 1000, user=user)
+                 for i in range(100)]
+
+        with get_session() as DB:
+            DB.add(user)
+            DB.add_all(posts)
+
+        steps = []
+        path = backup.backup(self.app.config["DATABASE_PATH"], self.directory,
+                             pages=10, pace=0,
+                             progress=lambda *step: steps.append(step))
+
+        self.assertGreater(len(steps), 1)
+        self.assertEqual(steps[-1][0], 0)
+        self.assertEqual(os.listdir(self.directory),
+                         [os.path.basename(path)])
+
+        snapshot = sqlite3.connect(path)
+        try:
+            self.assertEqual(
+                snapshot.execute("SELECT count(*) FROM posts").fetchone(),
+                (100,))
+            self.assertEqual(
+                snapshot.execute("PRAGMA journal_mode").fetchone(),
+                ("delete",))
+        finally:
+            snapshot.close()
@@ -0,0 +1,205 @@
+
+import json
+import threading
+import time
+from unittest import TestCase
+
+from ..app import init_cache
+from ..cache import LRUCache
+from ..db import get_session
+from ..models import Post, User
+
+from .base import AppTestCase
+
+
+class TestLRUCache(TestCase):
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used entry is evicted once the cache
+        is full.
+
+        """
+
+        cache = LRUCache(2, 1000, 60)
+        cache.get("a", [], lambda: ("A", 1))
+        cache.get("b", [], lambda: ("B", 1))
+        cache.get("a", [], lambda: ("X", 1))
+        cache.get("c", [], lambda: ("C", 1))
+
+        self.assertEqual(cache.get("a", [], lambda: ("X", 1)), "A")
+        self.assertEqual(cache.get("b", [], lambda: ("X", 1)), "X")
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_byte_limit(self):
+        """Test that the total size of the entries is kept under the byte
+        limit, and that entries larger than the limit are not cached.
+
+        """
+
+        cache = LRUCache(100, 10, 60)
+        cache.get("a", [], lambda: ("A", 6))
+        cache.get("b", [], lambda: ("B", 6))
+        cache.get("c", [], lambda: ("C", 11))
+
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["bytes"], 6)
+
+    def test_expiry(self):
+        """Test that entries are loaded again once they have expired."""
+
+        cache = LRUCache(10, 100, 0.01)
+        cache.get("a", [], lambda: ("A", 1))
+        time.sleep(0.02)
+        self.assertEqual(cache.get("a", [], lambda: ("B", 1)), "B")
+
+    def test_invalidate_tag(self):
+        """Test that invalidating a tag removes every entry labelled with
+        it.
+
+        """
+
+        cache = LRUCache(10, 100, 60)
+        cache.get("a", ["x"], lambda: ("A", 1))
+        cache.get("b", ["x", "y"], lambda: ("B", 1))
+        cache.get("c", ["y"], lambda: ("C", 1))
+
+        cache.invalidate("x")
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.get("c", ["y"], lambda: ("X", 1)), "C")
+
+    def test_concurrent_misses_collapsed(self):
+        """Test that concurrent misses for the same key are served by a single
+        load.
+
+        """
+
+        cache = LRUCache(10, 100, 60)
+        started = threading.Event()
+        release = threading.Event()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            started.set()
+            release.wait()
+            return "A", 1
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(cache.get("a", [], loader)))
+            for _ in range(5)]
+
+        threads[0].start()
+        started.wait()
+        for t in threads[1:]:
+            t.start()
+        while cache.stats()["collapsed"] < 4:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(results, ["A"] * 5)
+
+    def test_invalidated_load_not_stored(self):
+        """Test that a value loaded while its tag is invalidated is returned
+        but not cached.
+
+        """
+
+        cache = LRUCache(10, 100, 60)
+
+        def loader():
+            cache.invalidate("x")
+            return "old", 1
+
+        self.assertEqual(cache.get("a", ["x"], loader), "old")
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class TestResponseCache(AppTestCase):
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+        self.app.config["RESPONSE_CACHE_ENABLED"] = True
+        init_cache(self.app)
+
+    def stats(self):
+        return json.loads(self.client.get("/api/_cache").data)
+
+    def test_user_cached_and_invalidated(self):
+        """Test that responses for a user are cached until the user is
+        updated.
+
+        """
+
+        user = User(name="Jill", email="jill@test.com")
+
+        with get_session() as DB:
+            DB.add(user)
+
+        url = "/api/user/{0}".format(user.id)
+        self.client.get(url)
+        rv = self.client.get(url)
+        self.assertEqual(json.loads(rv.data), user.to_dict())
+        self.assertEqual(self.stats()["hits"], 1)
+
+        self.client.put(url, data=json.dumps({"name": "Jack"}))
+        rv = self.client.get(url)
+        self.assertEqual(json.loads(rv.data)["name"], "Jack")
+        self.assertEqual(self.stats()["hits"], 1)
+
+    def test_cached_not_modified(self):
+        """Test that a cached response is not sent again if the client's copy
+        is current.
+
+        """
+
+        user = User(name="Jill", email="jill@test.com")
+
+        with get_session() as DB:
+            DB.add(user)
+
+        url = "/api/user/{0}".format(user.id)
+        etag = self.client.get(url, headers={"If-None-Match": "x"}) \
+            .headers["ETag"]
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(self.stats()["hits"], 1)
+
+    def test_errors_not_cached(self):
+        """Test that error responses are not cached."""
+
+        self.client.get("/api/user/1")
+        self.assertEqual(self.stats()["entries"], 0)
+
+    def test_user_delete_invalidates_posts(self):
+        """Test that deleting a user removes the cached responses for their
+        posts.
+
+        """
+
+        user = User(name="Jill", email="jill@test.com")
+        post = Post(title="Title", body="Body", user=user)
+
+        with get_session() as DB:
+            DB.add_all([user, post])
+
+        url = "/api/user/{0}/post/{1}".format(user.id, post.id)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.stats()["entries"], 1)
+
+        self.client.delete("/api/user/{0}".format(user.id))
+        self.assertEqual(self.stats()["entries"], 0)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_cache_stats_disabled(self):
+        """Test that the cache statistics are not found when the cache is
+        disabled.
+
+        """
+
+        self.app.config["RESPONSE_CACHE_ENABLED"] = False
+        init_cache(self.app)
+        self.assertEqual(self.client.get("/api/_cache").status_code, 404)
@@ -0,0 +1,96 @@
+import gzip
+import json
+import zlib
+
+from ..db import get_session
+from ..models import Post, User
+
+from .base import AppTestCase
+
+
+class TestCompression(AppTestCase):
+    def setUp(self):
+        super(TestCompression, self).setUp()
+
+        user = User(name="Jill", email="jill@test.com")
+        with get_session() as DB:
+            DB.add(user)
+            DB.add_all([Post(title="Post {0}".format(i), body="Body. " * 50,
+                             user=user) for i in range(20)])
+
+        self.user_id = user.id
+
+    def test_large_responses_compressed(self):
+        """Test that responses above the size threshold are compressed with
+        the coding the client prefers, and smaller ones are not.
+
+        """
+
+        url = "/api/user/{0}/post".format(self.user_id)
+
+        rv = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(rv.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", rv.headers["Vary"])
+        posts = json.loads(gzip.decompress(rv.data).decode("utf-8"))
+        self.assertEqual(len(posts), 20)
+        self.assertLess(len(rv.data), len(json.dumps(posts)))
+
+        rv = self.client.get(url, headers={
+            "Accept-Encoding": "gzip;q=0.5, deflate"})
+        self.assertEqual(rv.headers["Content-Encoding"], "deflate")
+        self.assertEqual(json.loads(zlib.decompress(rv.data).decode("utf-8")),
+                         posts)
+
+        rv = self.client.get(url)
+        self.assertNotIn("Content-Encoding", rv.headers)
+        self.assertEqual(json.loads(rv.data), posts)
+
+        rv = self.client.get("/api/user/{0}".format(self.user_id),
+                             headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", rv.headers)
+
+        self.app.config["COMPRESSION_MIN_SIZE"] = 0
+        rv = self.client.get("/api/user/{0}".format(self.user_id),
+                             headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(rv.headers["Content-Encoding"], "gzip")
+
+    def test_streamed_responses_compressed(self):
+        """Test that streamed responses are compressed as they are streamed."""
+
+        self.app.config["STREAM_CHUNK_SIZE"] = 3
+
+        rv = self.client.get("/api/user/{0}/post?stream=true".format(
+            self.user_id), headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(rv.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(
+            gzip.decompress(rv.data).decode("utf-8"))), 20)
+
+        # The first chunk can be decompressed as soon as it is received.
+        rv = self.client.get("/api/user/{0}/post?stream=true".format(
+            self.user_id), headers={"Accept-Encoding": "gzip"},
+            buffered=False)
+        first = next(iter(rv.response))
+        rv.close()
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertTrue(decompressor.decompress(first).startswith(b"[{"))
+
+    def test_compressed_etag_weak(self):
+        """Test that a compressed response has a weak ETag, which can still be
+        used in conditional requests.
+
+        """
+
+        self.app.config["COMPRESSION_MIN_SIZE"] = 0
+        url = "/api/user/{0}".format(self.user_id)
+
+        rv = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        etag = rv.headers["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+
+        rv = self.client.get(url, headers={"Accept-Encoding": "gzip",
+                                           "If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+
+        rv = self.client.put(url, data=json.dumps({"name": "Jane"}),
+                             headers={"If-Match": etag})
+        self.assertEqual(rv.status_code, 200)
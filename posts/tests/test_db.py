@@ -0,0 +1,223 @@
+import json
+import os
+import tempfile
+import threading
+
+from sqlalchemy.exc import OperationalError
+
+from .. import db
+from ..app import create_app, init_db
+from ..db import get_session, pool
+from ..db.audit import QueryPlanError
+from ..models import Post, User
+
+from .base import AppTestCase
+
+
+class TestDatabase(AppTestCase):
+    def test_sqlite_preset(self):
+        """Test that the settings of the configured preset are applied to
+        database connections.
+
+        """
+
+        self.app.config["SQLITE_PRESET"] = "throughput"
+        init_db(self.app)
+
+        pragmas = db.read_pragmas()
+        self.assertEqual(pragmas["journal_mode"], "wal")
+        self.assertEqual(pragmas["synchronous"], 1)  # NORMAL
+        self.assertEqual(pragmas["temp_store"], 2)  # MEMORY
+        self.assertEqual(pragmas["cache_size"], -65536)
+        self.assertEqual(pragmas["busy_timeout"], 5000)
+
+        rv = self.client.get("/api/_sqlite")
+        self.assertEqual(json.loads(rv.data), pragmas)
+
+    def test_sqlite_pragma_overrides(self):
+        """Test that individual settings override those of the preset."""
+
+        self.app.config["SQLITE_PRESET"] = "durability"
+        self.app.config["SQLITE_PRAGMAS"] = {"busy_timeout": 100}
+        init_db(self.app)
+
+        pragmas = db.read_pragmas()
+        self.assertEqual(pragmas["synchronous"], 2)  # FULL
+        self.assertEqual(pragmas["busy_timeout"], 100)
+
+    def test_sqlite_invalid_pragmas(self):
+        """Test that unknown settings and invalid values are rejected."""
+
+        with self.assertRaises(ValueError):
+            db.sqlite_pragmas({"writable_schema": 1})
+
+        with self.assertRaises(ValueError):
+            db.sqlite_pragmas({"journal_mode": "WAL; DROP TABLE users"})
+
+    def test_session_closed_after_request(self):
+        """Test that the session used by a request is closed and its
+        connection returned to the pool when the request ends.
+
+        """
+
+        with db.get_session() as DB:
+            DB.add(User(name="Jill", email="jill@test.com"))
+
+        self.assertFalse(db.Session.registry.has())
+
+        rv = self.client.get("/api/user")
+        self.assertEqual(rv.status_code, 200)
+        self.assertFalse(db.Session.registry.has())
+        self.assertFalse(db.ReadSession.registry.has())
+
+        rv = self.client.post("/api/user", data=json.dumps(
+            {"name": "Jack", "email": "jack@test.com"}))
+        self.assertEqual(rv.status_code, 201)
+        self.assertFalse(db.Session.registry.has())
+        self.assertFalse(db.ReadSession.registry.has())
+
+        status = db.pool_status()
+        self.assertEqual(status["checked_out"], 0)
+        self.assertEqual(status["leaks"], 0)
+        self.assertGreater(status["checkouts"], 0)
+
+    def test_connection_leak_reported(self):
+        """Test that a connection which is still checked out when a request
+        ends is reported.
+
+        """
+
+        connection = db.engine.connect()
+
+        with self.assertLogs(pool.logger, "WARNING"):
+            self.assertEqual(pool.stats.check_leaks(), 1)
+
+        connection.close()
+        self.assertEqual(pool.stats.check_leaks(), 0)
+        self.assertEqual(db.pool_status()["leaks"], 1)
+
+    def test_query_plan_audit(self):
+        """Test that a statement issued during a request which scans a whole
+        audited table is rejected.
+
+        """
+
+        with self.app.test_request_context():
+            with self.assertRaises(QueryPlanError):
+                with get_session() as DB:
+                    DB.query(Post).filter(Post.body == "Body").all()
+
+            with get_session() as DB:
+                DB.query(Post).filter(Post.id == 1).all()
+
+    def test_posts_user_index(self):
+        """Test that a user's posts are found through the index on their user
+        ID, including for databases created before the index was added.
+
+        """
+
+        with get_session() as DB:
+            DB.execute("DROP INDEX ix_posts_user_id_id")
+
+        init_db(self.app)
+
+        with get_session() as DB:
+            plan = DB.execute("EXPLAIN QUERY PLAN SELECT id FROM posts "
+                              "WHERE user_id = 1 AND id > 0 ORDER BY id")
+            self.assertIn("USING COVERING INDEX ix_posts_user_id_id",
+                          " ".join(row[-1] for row in plan))
+
+    def test_version_column_added(self):
+        """Test that the version column is added to databases created before
+        it, with existing rows at the first version.
+
+        """
+
+        with get_session() as DB:
+            DB.add(User(name="Jill", email="jill@test.com"))
+
+        with get_session() as DB:
+            DB.execute("ALTER TABLE users DROP COLUMN version")
+
+        db.create_schema()
+
+        rv = self.client.get("/api/user/1")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.headers["ETag"], '"1.1"')
+
+    def test_write_coordinator(self):
+        """Test that concurrent writes are grouped into shared transactions,
+        and that each request receives its own result or error.
+
+        """
+
+        self.app.config["WRITE_COORDINATOR"] = True
+        self.app.config["WRITE_MAX_WAIT"] = 0.05
+        init_db(self.app)
+
+        emails = ["user{0}@test.com".format(i) for i in range(10)]
+        emails.append(emails[0])
+        statuses = []
+
+        def create(email):
+            rv = self.app.test_client().post("/api/user", data=json.dumps(
+                {"name": "User", "email": email}))
+            statuses.append(rv.status_code)
+
+        threads = [threading.Thread(target=create, args=(e,)) for e in emails]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] * 10 + [409])
+        self.assertLess(db.write_coordinator.batches,
+                        db.write_coordinator.writes)
+
+        with get_session() as DB:
+            self.assertEqual(sorted(u.email for u in User.all(DB)),
+                             sorted(emails[:10]))
+
+    def test_read_only_sessions(self):
+        """Test that GET requests read through connections which cannot write
+        to the database, and other requests through the writing engine.
+
+        """
+
+        with self.app.test_request_context(method="GET"):
+            with self.assertRaises(OperationalError):
+                with get_session() as DB:
+                    DB.execute("INSERT INTO users (name, email, version) "
+                               "VALUES ('Jill', 'jill@test.com', 1)")
+
+            with get_session() as DB:
+                self.assertIs(DB.get_bind(), db.read_engine)
+
+        with self.app.test_request_context(method="POST"):
+            with get_session() as DB:
+                self.assertIs(DB.get_bind(), db.engine)
+                User.create(DB, name="Jill", email="jill@test.com")
+
+        rv = self.client.get("/api/user")
+        self.assertEqual(len(json.loads(rv.data)), 1)
+
+    def test_create_app_without_database_access(self):
+        """Test that creating an app does not touch the database, which is
+        only connected to when it is first used.
+
+        """
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "posts.db")
+
+        try:
+            create_app({"DATABASE_PATH": path})
+            self.assertFalse(os.path.exists(path))
+
+            db.create_schema()
+            self.assertTrue(os.path.exists(path))
+        finally:
+            db.dispose()
+            for filename in os.listdir(directory):
+                os.unlink(os.path.join(directory, filename))
+            os.rmdir(directory)
@@ -0,0 +1,121 @@
+import json
+from unittest import TestCase
+
+from .. import db
+from ..app import init_db, init_metrics
+from ..metrics import Metrics
+
+from .base import AppTestCase
+
+
+class TestMetrics(TestCase):
+    def test_histogram_buckets_cumulative(self):
+        """Test that request durations are rendered as cumulative buckets."""
+
+        metrics = Metrics()
+        metrics.observe_request("users.list", "GET", 200, 0.003)
+        metrics.observe_request("users.list", "GET", 200, 0.2)
+        metrics.observe_request("users.list", "GET", 404, 20)
+
+        lines = metrics.render().splitlines()
+        labels = 'endpoint="users.list",method="GET"'
+
+        self.assertIn('posts_http_requests_total{{{0},status="200"}} 2'
+                      .format(labels), lines)
+        self.assertIn('posts_http_requests_total{{{0},status="404"}} 1'
+                      .format(labels), lines)
+        self.assertIn('posts_http_request_duration_seconds_bucket'
+                      '{{{0},le="0.005"}} 1'.format(labels), lines)
+        self.assertIn('posts_http_request_duration_seconds_bucket'
+                      '{{{0},le="0.25"}} 2'.format(labels), lines)
+        self.assertIn('posts_http_request_duration_seconds_bucket'
+                      '{{{0},le="+Inf"}} 3'.format(labels), lines)
+        self.assertIn('posts_http_request_duration_seconds_count{{{0}}} 3'
+                      .format(labels), lines)
+
+
+class TestMetricsEndpoint(AppTestCase):
+    def test_metrics_disabled(self):
+        """Test that metrics are not served unless they are enabled."""
+
+        self.assertEqual(self.client.get("/api/_metrics").status_code, 404)
+
+    def test_metrics(self):
+        """Test that requests and the statements they execute are recorded."""
+
+        self.app.config["METRICS_ENABLED"] = True
+        self.app.config["DATABASE_CREATE_SCHEMA"] = False
+        init_metrics(self.app)
+        init_db(self.app)
+
+        self.client.get("/api/user")
+        self.client.get("/api/user/1")
+
+        rv = self.client.get("/api/_metrics")
+        self.assertEqual(rv.status_code, 200)
+        self.assertTrue(rv.headers["Content-Type"].startswith("text/plain"))
+
+        text = rv.data.decode()
+        self.assertIn('posts_http_requests_total{endpoint="users.list",'
+                      'method="GET",status="200"} 1', text)
+        self.assertIn('posts_http_requests_total{endpoint="users.view",'
+                      'method="GET",status="404"} 1', text)
+        self.assertIn('posts_sql_statement_duration_seconds_count'
+                      '{operation="SELECT"} 2', text)
+        self.assertIn("posts_db_pool_checkouts ", text)
+
+    def test_failed_statements(self):
+        """Test that statements which raise an error are recorded, and leave
+        nothing behind on their connection.
+
+        """
+
+        self.app.config["METRICS_ENABLED"] = True
+        self.app.config["DATABASE_CREATE_SCHEMA"] = False
+        init_metrics(self.app)
+        init_db(self.app)
+
+        data = json.dumps({"name": "Jill", "email": "jill@test.com"})
+        for _ in range(3):
+            self.client.post("/api/user", data=data)
+
+        text = self.client.get("/api/_metrics").data.decode()
+        self.assertIn('posts_sql_statement_errors_total{operation="INSERT"} 2',
+                      text)
+        self.assertIn('posts_sql_statement_duration_seconds_count'
+                      '{operation="INSERT"} 3', text)
+
+        for engine in db.engines():
+            for record in engine.pool._pool.queue:
+                self.assertFalse(record.info.get("statement_start"))
+
+
+class TestServerTiming(AppTestCase):
+    def phases(self, rv):
+        return [p.split(";")[0]
+                for p in rv.headers["Server-Timing"].split(", ")]
+
+    def test_server_timing_disabled(self):
+        """Test that no Server-Timing header is sent unless it is enabled."""
+
+        self.assertNotIn("Server-Timing", self.client.get("/api/user").headers)
+
+    def test_server_timing(self):
+        """Test that the phases of a request are reported in the Server-Timing
+        header.
+
+        """
+
+        self.app.config["SERVER_TIMING_ENABLED"] = True
+
+        rv = self.client.post("/api/user", data=json.dumps(
+            {"name": "Jill", "email": "jill@test.com"}))
+        self.assertEqual(rv.status_code, 201)
+        self.assertEqual(self.phases(rv),
+                         ["parse", "db", "serialize", "render", "total"])
+
+        rv = self.client.get("/api/user")
+        self.assertEqual(self.phases(rv), ["db", "render", "total"])
+
+        for phase in rv.headers["Server-Timing"].split(", "):
+            self.assertGreaterEqual(float(phase.split("dur=")[1]), 0)
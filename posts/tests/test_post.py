@@ -30,6 +30,108 @@ class TestPost(AppTestCase):
         expected = [p.to_dict() for p in posts[:2]]
         self.assertEqual(json.loads(rv.data), expected)
 
+    def test_list_posts_paginated(self):
+        """Test that the list of a user's posts is split into pages."""
+
+        user = User(name="John", email="john@email.com")
+        other = User(name="James", email="james@email.com")
+
+        posts = [Post(title="Post {0}".format(i), body="Body.", user=user)
+                 for i in range(3)]
+        posts.insert(1, Post(title="Other", body="Body.", user=other))
+
+        with get_session() as DB:
+            DB.add_all([user, other])
+            DB.add_all(posts)
+
+        rv = self.client.get("/api/user/{0}/post?limit=2".format(user.id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data),
+                         [posts[0].to_dict(), posts[2].to_dict()])
+        self.assertEqual(rv.headers["Link"],
+                         '</api/user/{0}/post?after={1}&limit=2>; rel="next"'
+                         .format(user.id, posts[2].id))
+
+        rv = self.client.get("/api/user/{0}/post?limit=2&after={1}"
+                             .format(user.id, posts[2].id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), [posts[3].to_dict()])
+        self.assertNotIn("Link", rv.headers)
+
+    def test_list_posts_streamed(self):
+        """Test that the whole list of a user's posts can be streamed."""
+
+        self.app.config["STREAM_CHUNK_SIZE"] = 2
+
+        user = User(name="John", email="john@email.com")
+        other = User(name="James", email="james@email.com")
+
+        posts = [Post(title="Post {0}".format(i), body="Body.", user=user)
+                 for i in range(5)]
+
+        with get_session() as DB:
+            DB.add_all([user, other])
+            DB.add_all(posts)
+            DB.add(Post(title="Other", body="Body.", user=other))
+
+        rv = self.client.get("/api/user/{0}/post?stream=true".format(user.id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), [p.to_dict() for p in posts])
+
+        rv = self.client.get("/api/user/{0}/post?stream=true"
+                             .format(other.id + 100))
+        self.assertEqual(rv.status_code, 404)
+
+    def test_list_posts_fields(self):
+        """Test that the list of a user's posts can be restricted to some of
+        their fields, and that the other columns are not selected.
+
+        """
+
+        user = User(name="John", email="john@email.com")
+        posts = [Post(title="Post {0}".format(i), body="Body.", user=user)
+                 for i in range(3)]
+
+        with get_session() as DB:
+            DB.add(user)
+            DB.add_all(posts)
+
+        rv = self.client.get("/api/user/{0}/post?fields=title&limit=2"
+                             .format(user.id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data),
+                         [{"id": p.id, "title": p.title} for p in posts[:2]])
+        self.assertIn("fields=title", rv.headers["Link"])
+
+        columns, _ = Post.reader(Post.select_fields(["title"]))
+        self.assertEqual([c.key for c in columns], ["id", "title"])
+
+        rv = self.client.get("/api/user/{0}/post?fields=title,user_id"
+                             .format(user.id))
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.data)["error"],
+                         "Post model does not have a field named 'user_id'")
+
+    def test_view_post_fields(self):
+        """Test that a single post can be restricted to some of its fields,
+        and that its ETag depends on the fields.
+
+        """
+
+        user = User(name="Jill", email="jill@email.com")
+        post = Post(title="Post", body="Some post body.", user=user)
+
+        with get_session() as DB:
+            DB.add_all([user, post])
+
+        url = "/api/user/{0}/post/{1}".format(user.id, post.id)
+        rv = self.client.get(url + "?fields=body")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), {"id": post.id,
+                                               "body": post.body})
+        self.assertNotEqual(rv.headers["ETag"],
+                            self.client.get(url).headers["ETag"])
+
     def test_list_posts_no_user(self):
         """Test the API endpoint for listing posts when a user does not exist
         in the database.
@@ -185,6 +287,59 @@ class TestPost(AppTestCase):
         self.assertEqual(json.loads(rv.data)["error"],
                          "No post body was provided.")
 
+    def test_bulk_create_posts(self):
+        """Test the endpoint for creating many posts at once."""
+
+        user = User(name="Jill", email="jill@jill.com")
+
+        with get_session() as DB:
+            DB.add(user)
+
+        data = [{"title": "Post {0}".format(i), "body": "Body {0}".format(i)}
+                for i in range(3)]
+
+        rv = self.client.post("/api/user/{0}/post/bulk".format(user.id),
+                              data=json.dumps(data))
+        self.assertEqual(rv.status_code, 201)
+
+        returned = json.loads(rv.data)
+        self.assertEqual([{"title": p["title"], "body": p["body"]}
+                          for p in returned], data)
+
+        with get_session() as DB:
+            posts = DB.query(Post).filter(Post.user_id == user.id) \
+                .order_by(Post.id).all()
+
+        self.assertEqual([p.to_dict() for p in posts], returned)
+
+    def test_bulk_create_posts_invalid(self):
+        """Test that no posts are created in bulk if any of them are
+        invalid.
+
+        """
+
+        user = User(name="Jill", email="jill@jill.com")
+
+        with get_session() as DB:
+            DB.add(user)
+
+        data = [{"title": "Title", "body": "Body"}, {"title": "No body"},
+                {"title": {"x": 1}, "body": "Body"}]
+
+        rv = self.client.post("/api/user/{0}/post/bulk".format(user.id),
+                              data=json.dumps(data))
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.data)["items"], [
+            {"index": 1, "error": "No post body was provided."},
+            {"index": 2, "error": "The post title must be a string."}])
+
+        rv = self.client.post("/api/user/{0}/post/bulk".format(user.id + 10),
+                              data=json.dumps(data[:1]))
+        self.assertEqual(rv.status_code, 404)
+
+        with get_session() as DB:
+            self.assertEqual(DB.query(Post).count(), 0)
+
     def test_update_post(self):
         """Test the endpoint for updating a post."""
 
@@ -214,6 +369,38 @@ class TestPost(AppTestCase):
         self.assertEqual(updated.title, data["title"])
         self.assertEqual(updated.body, post.body)
 
+    def test_update_post_if_match(self):
+        """Test that an update to a post is only applied if the If-Match
+        header names the current version of the post.
+
+        """
+
+        user = User(name="Joe B", email="joe@email.com")
+        post = Post(title="Title", body="Body.", user=user)
+
+        with get_session() as DB:
+            DB.add_all([user, post])
+
+        url = "/api/user/{0}/post/{1}".format(user.id, post.id)
+        etag = self.client.get(url).headers["ETag"]
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+
+        rv = self.client.put(url, data=json.dumps({"title": "New"}),
+                             headers={"If-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+
+        rv = self.client.put(url, data=json.dumps({"title": "Newer"}),
+                             headers={"If-Match": etag})
+        self.assertEqual(rv.status_code, 412)
+        self.assertEqual(json.loads(rv.data)["error"],
+                         "The post has been modified.")
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data)["title"], "New")
+
     def test_update_post_no_user(self):
         """Test the endpoint for updating a post when the user does not exist
         in the database.
@@ -292,3 +479,67 @@ class TestPost(AppTestCase):
         rv = self.client.delete("/api/user/{0}/post/{1}"
                                 .format(user.id, post.id))
         self.assertEqual(rv.status_code, 204)
+
+    def test_bulk_update_and_delete_posts(self):
+        """Test that a user's posts can be updated and deleted by a list of
+        IDs or a filter, and that only their posts are changed.
+
+        """
+
+        user = User(name="Jill", email="jill@test.com")
+        other = User(name="Jack", email="jack@test.com")
+        posts = [Post(title="Spam" if i % 2 else "Ham", body="Body.",
+                      user=user) for i in range(6)]
+        others = [Post(title="Spam", body="Body.", user=other)]
+
+        with get_session() as DB:
+            DB.add_all([user, other])
+            DB.add_all(posts + others)
+
+        url = "/api/user/{0}/post".format(user.id)
+
+        rv = self.client.patch(url, data=json.dumps(
+            {"filter": {"title": "Spam"}, "updates": {"body": "Removed."}}))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), {"updated": 3})
+
+        rv = self.client.get("{0}/{1}".format(url, posts[1].id))
+        self.assertEqual(json.loads(rv.data)["body"], "Removed.")
+        self.assertEqual(rv.headers["ETag"], '"{0}.2"'.format(posts[1].id))
+
+        rv = self.client.delete(url, data=json.dumps(
+            {"ids": [posts[0].id, posts[1].id, others[0].id]}))
+        self.assertEqual(json.loads(rv.data), {"deleted": 2})
+
+        rv = self.client.delete(url, data=json.dumps({"filter": {}}))
+        self.assertEqual(json.loads(rv.data), {"deleted": 4})
+
+        with get_session() as DB:
+            self.assertEqual([p.id for p in Post.all(DB)], [others[0].id])
+
+        for data, error in (
+                ({"ids": [1], "filter": {}}, "Either a list of IDs or a "
+                                             "filter must be provided."),
+                ({"ids": ["1"]}, "A list of IDs must be provided."),
+                ({"ids": [True]}, "A list of IDs must be provided."),
+                ({"filter": {"title": ["t"]}}, "The title filter must be a "
+                                               "string."),
+                ({"filter": {"id": "1"}}, "The id filter must be an "
+                                          "integer."),
+                ({"filter": {"user": 1}}, "Post model does not have a field "
+                                          "named 'user'")):
+            rv = self.client.delete(url, data=json.dumps(data))
+            self.assertEqual(rv.status_code, 400)
+            self.assertEqual(json.loads(rv.data)["error"], error)
+
+        rv = self.client.patch(url, data=json.dumps(
+            {"ids": [1], "updates": {"user_id": other.id}}))
+        self.assertEqual(rv.status_code, 400)
+
+        rv = self.client.patch(url, data=json.dumps(
+            {"ids": [1], "updates": {"body": {"a": 1}}}))
+        self.assertEqual(rv.status_code, 400)
+
+        rv = self.client.delete("/api/user/{0}/post".format(other.id + 1),
+                                data=json.dumps({"filter": {}}))
+        self.assertEqual(rv.status_code, 404)
@@ -0,0 +1,111 @@
+import json
+
+from .. import db
+from ..db import get_session
+from ..models import Post, User
+
+from .base import AppTestCase
+
+
+class TestQueryBudget(AppTestCase):
+    """Each endpoint must execute no more than a fixed number of statements on
+    its successful path.
+
+    """
+
+    def setUp(self):
+        super(TestQueryBudget, self).setUp()
+
+        self.user = User(name="Jill", email="jill@test.com")
+        self.post = Post(title="Post", body="A post.", user=self.user)
+
+        with get_session() as DB:
+            DB.add(self.user)
+            DB.add(self.post)
+
+        self.user_url = "/api/user/{0}".format(self.user.id)
+        self.posts_url = self.user_url + "/post"
+        self.post_url = self.posts_url + "/{0}".format(self.post.id)
+
+    def request(self, method, url, budget, status_code, data=None,
+                headers=None):
+        if data is not None:
+            data = json.dumps(data)
+
+        with self.assertQueryBudget(budget):
+            rv = self.client.open(url, method=method, data=data,
+                                  headers=headers)
+
+        self.assertEqual(rv.status_code, status_code)
+        return rv
+
+    def test_user_budgets(self):
+        """Test the number of statements executed by the user endpoints."""
+
+        self.request("GET", "/api/user", 1, 200)
+        self.request("GET", self.user_url, 1, 200)
+        self.request("POST", "/api/user", 1, 201,
+                     {"name": "Jack", "email": "jack@test.com"})
+        self.request("PUT", self.user_url, 2, 200, {"name": "Jane"},
+                     {"If-Match": '"{0}.1"'.format(self.user.id)})
+        self.request("POST", "/api/user/bulk", 3, 201,
+                     [{"name": "Bob", "email": "bob@test.com"}])
+        self.request("DELETE", self.user_url, 1, 204)
+
+    def test_post_budgets(self):
+        """Test the number of statements executed by the post endpoints."""
+
+        self.request("GET", self.posts_url, 1, 200)
+        self.request("GET", self.post_url, 1, 200)
+        self.request("POST", self.posts_url, 1, 201,
+                     {"title": "Another", "body": "Another post."})
+        self.request("PUT", self.post_url, 2, 200, {"title": "Renamed"},
+                     {"If-Match": '"{0}.1"'.format(self.post.id)})
+        self.request("POST", self.posts_url + "/bulk", 2, 201,
+                     [{"title": "Bulk", "body": "A bulk post."}])
+        self.request("PATCH", self.posts_url, 1, 200,
+                     {"filter": {"title": "Bulk"},
+                      "updates": {"body": "New."}})
+        self.request("DELETE", self.posts_url, 1, 200,
+                     {"ids": [self.post.id + 1]})
+        self.request("DELETE", self.post_url, 1, 204)
+
+    def test_search_budget(self):
+        """Test the number of statements executed by a search."""
+
+        if not db.search_enabled():
+            self.skipTest("SQLite does not support FTS5.")
+
+        self.request("GET", "/api/post/search?q=post", 1, 200)
+
+    def test_missing_user(self):
+        """Test that posts can be neither read nor created for a user who does
+        not exist.
+
+        """
+
+        url = "/api/user/{0}/post".format(self.user.id + 1)
+
+        for method, path, data in (
+                ("GET", url, None),
+                ("GET", url + "/{0}".format(self.post.id), None),
+                ("PUT", url + "/{0}".format(self.post.id), {"title": "New"}),
+                ("POST", url, {"title": "New", "body": "A new post."}),
+                ("POST", url + "/bulk", [{"title": "New", "body": "Body."}])):
+            rv = self.request(method, path, 2, 404, data)
+            self.assertEqual(json.loads(rv.data)["error"],
+                             "No such user found.")
+
+        # A post is only found for the user who owns it.
+        with get_session() as DB:
+            other = User.create(DB, name="Jack", email="jack@test.com")
+
+        rv = self.client.get("/api/user/{0}/post/{1}".format(
+            other.id, self.post.id))
+        self.assertEqual(rv.status_code, 404)
+        self.assertEqual(json.loads(rv.data)["error"], "No such post found.")
+
+        rv = self.client.delete("/api/user/{0}/post/{1}".format(
+            other.id, self.post.id))
+        self.assertEqual(rv.status_code, 204)
+        self.assertEqual(self.client.get(self.post_url).status_code, 200)
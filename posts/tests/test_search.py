@@ -0,0 +1,103 @@
+
+import json
+
+from .. import db
+from ..db import get_session
+from ..models import Post, User
+
+from .base import AppTestCase
+
+
+class TestSearch(AppTestCase):
+    def setUp(self):
+        super(TestSearch, self).setUp()
+
+        self.user = User(name="Jill", email="jill@test.com")
+        self.other = User(name="Jack", email="jack@test.com")
+        self.posts = [
+            Post(title="Gardening", body="Tomatoes and potatoes.",
+                 user=self.user),
+            Post(title="Tomatoes", body="Tomatoes, tomatoes, tomatoes.",
+                 user=self.user),
+            Post(title="Cooking", body="A tomatoes recipe.", user=self.other),
+            Post(title="Hiking", body="Up a hill.", user=self.other)]
+
+        with get_session() as DB:
+            DB.add_all([self.user, self.other])
+            DB.add_all(self.posts)
+
+    def search(self, query):
+        rv = self.client.get("/api/post/search?" + query)
+        self.assertEqual(rv.status_code, 200)
+        return rv, [p["id"] for p in json.loads(rv.data)]
+
+    def test_search(self):
+        """Test that posts matching a query are returned, best match
+        first.
+
+        """
+
+        _, ids = self.search("q=tomatoes")
+        self.assertEqual(ids[0], self.posts[1].id)
+        self.assertEqual(sorted(ids), sorted(p.id for p in self.posts[:3]))
+
+    def test_search_user(self):
+        """Test that a search can be restricted to the posts of a user."""
+
+        _, ids = self.search("q=tomatoes&user_id={0}".format(self.other.id))
+        self.assertEqual(ids, [self.posts[2].id])
+
+    def test_search_paginated(self):
+        """Test that search results are split into pages."""
+
+        rv, first = self.search("q=tomatoes&limit=2&fields=title")
+        self.assertEqual(len(first), 2)
+        self.assertEqual(set(json.loads(rv.data)[0]), {"id", "title"})
+
+        rv, second = self.search(rv.headers["Link"].split(">")[0]
+                                 .split("?")[1])
+        self.assertEqual(len(second), 1)
+        self.assertNotIn(second[0], first)
+        self.assertNotIn("Link", rv.headers)
+
+    def test_search_follows_changes(self):
+        """Test that the search index is kept up to date as posts are
+        updated and deleted.
+
+        """
+
+        self.client.put("/api/user/{0}/post/{1}"
+                        .format(self.other.id, self.posts[3].id),
+                        data=json.dumps({"body": "Tomatoes on a hill."}))
+        _, ids = self.search("q=hill")
+        self.assertEqual(ids, [self.posts[3].id])
+
+        self.client.delete("/api/user/{0}".format(self.other.id))
+        _, ids = self.search("q=tomatoes")
+        self.assertEqual(sorted(ids), [self.posts[0].id, self.posts[1].id])
+
+    def test_search_rebuild(self):
+        """Test that the search index can be rebuilt from the posts."""
+
+        with get_session() as DB:
+            DB.execute("DELETE FROM posts_fts")
+
+        _, ids = self.search("q=hiking")
+        self.assertEqual(ids, [])
+
+        db.rebuild_search()
+        _, ids = self.search("q=hiking")
+        self.assertEqual(ids, [self.posts[3].id])
+
+    def test_search_invalid(self):
+        """Test the search endpoint with missing or invalid queries."""
+
+        rv = self.client.get("/api/post/search")
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.data)["error"],
+                         "No search query was provided.")
+
+        rv = self.client.get("/api/post/search?q=%22unbalanced")
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.data)["error"],
+                         "The search query is invalid.")
@@ -0,0 +1,138 @@
+import json
+import sqlite3
+
+from .. import db
+from ..db import sharding
+
+from .base import AppTestCase
+
+
+class TestSharding(AppTestCase):
+    config = {"DATABASE_SHARDS": 3}
+
+    def create_users(self, count):
+        ids = []
+
+        for i in range(count):
+            rv = self.client.post("/api/user", data=json.dumps(
+                {"name": "User", "email": "user{0}@test.com".format(i)}))
+            self.assertEqual(rv.status_code, 201)
+            ids.append(json.loads(rv.data)["id"])
+
+        return ids
+
+    def test_users_routed_by_id(self):
+        """Test that users and their posts are stored on the shard whose
+        range contains the user's ID, and are served from it.
+
+        """
+
+        ids = self.create_users(12)
+        self.assertEqual({db.shard_for_id(id_) for id_ in ids}, {0, 1, 2})
+
+        for id_ in ids:
+            rv = self.client.post("/api/user/{0}/post".format(id_),
+                                  data=json.dumps({"title": "Post",
+                                                   "body": "Body."}))
+            post_id = json.loads(rv.data)["id"]
+            self.assertEqual(db.shard_for_id(post_id), db.shard_for_id(id_))
+
+            rv = self.client.get("/api/user/{0}/post/{1}".format(id_,
+                                                                 post_id))
+            self.assertEqual(rv.status_code, 200)
+
+            connection = sqlite3.connect(
+                db.shards[db.shard_for_id(id_)].path)
+            self.assertEqual(connection.execute(
+                "SELECT COUNT(*) FROM posts WHERE user_id = ?",
+                (id_,)).fetchone(), (1,))
+            connection.close()
+
+            rv = self.client.get("/api/user/{0}/post?stream=true".format(id_))
+            self.assertEqual([p["id"] for p in json.loads(rv.data)],
+                             [post_id])
+
+        rv = self.client.get("/api/user/{0}".format(3 << sharding.ID_BITS))
+        self.assertEqual(rv.status_code, 404)
+
+    def test_list_users_across_shards(self):
+        """Test that listing users gathers them from every shard in order of
+        ID, a page or a stream at a time.
+
+        """
+
+        ids = sorted(self.create_users(12))
+
+        rv = self.client.get("/api/user?limit=5")
+        self.assertEqual([u["id"] for u in json.loads(rv.data)], ids[:5])
+
+        users = []
+        url = "/api/user?limit=5"
+        while url:
+            rv = self.client.get(url)
+            users += json.loads(rv.data)
+            url = rv.headers.get("Link", "").partition(">")[0][1:]
+
+        self.assertEqual([u["id"] for u in users], ids)
+
+        rv = self.client.get("/api/user?stream=true&after={0}&limit=4"
+                             .format(ids[3]))
+        self.assertEqual([u["id"] for u in json.loads(rv.data)], ids[4:8])
+
+    def test_email_unique_across_shards(self):
+        """Test that a user cannot take an email which belongs to a user on
+        another shard.
+
+        """
+
+        ids = self.create_users(12)
+        first, other = ids[0], next(
+            id_ for id_ in ids if db.shard_for_id(id_) !=
+            db.shard_for_id(ids[0]))
+
+        rv = self.client.put("/api/user/{0}".format(other), data=json.dumps(
+            {"email": "user0@test.com"}))
+        self.assertEqual(rv.status_code, 409)
+
+        rv = self.client.post("/api/user/bulk", data=json.dumps(
+            [{"name": "User", "email": "user{0}@test.com".format(i)}
+             for i in range(12, 0, -1)]))
+        self.assertEqual(rv.status_code, 400)
+
+        rv = self.client.delete("/api/user/{0}".format(first))
+        self.assertEqual(rv.status_code, 204)
+
+        rv = self.client.put("/api/user/{0}".format(other), data=json.dumps(
+            {"email": "user0@test.com"}))
+        self.assertEqual(rv.status_code, 200)
+
+    def test_search_across_shards(self):
+        """Test that searching without a user ID gathers the matches of every
+        shard.
+
+        """
+
+        if not db.search_enabled():
+            self.skipTest("SQLite does not support FTS5.")
+
+        post_ids = []
+
+        for id_ in self.create_users(6):
+            rv = self.client.post("/api/user/{0}/post".format(id_),
+                                  data=json.dumps({"title": "Shared",
+                                                   "body": "Body."}))
+            post_ids.append(json.loads(rv.data)["id"])
+
+        rv = self.client.get("/api/post/search?q=shared&limit=4")
+        first = json.loads(rv.data)
+        rv = self.client.get("/api/post/search?q=shared&limit=4&offset=4")
+        second = json.loads(rv.data)
+
+        self.assertEqual(len(first), 4)
+        self.assertEqual(sorted(p["id"] for p in first + second),
+                         sorted(post_ids))
+
+        rv = self.client.get("/api/post/search?q=shared&offset={0}"
+                             .format(2 ** 63 - 1))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), [])
@@ -0,0 +1,111 @@
+import io
+
+from .. import db, transfer
+from ..db import get_session
+from ..models import Post, User
+
+from .base import AppTestCase
+
+
+class TestTransfer(AppTestCase):
+    def test_import_validates_rows(self):
+        """Test that imported rows are checked with the same rules as the
+        views, and that invalid rows are skipped.
+
+        """
+
+        rows = [{"name": "Jill", "email": "jill@test.com"},
+                {"name": "Jack", "email": "not an email"},
+                {"name": "Jane", "email": "jill@test.com"},
+                {"name": "John", "email": "john@test.com"},
+                {"name": "Joan", "email": 5},
+                ["Jean", "jean@test.com"],
+                {"id": True, "name": "Joe", "email": "joe@test.com"}]
+        errors = []
+
+        inserted, skipped = transfer.import_rows(
+            "users", rows, batch_size=2,
+            on_error=lambda *error: errors.append(error))
+
+        self.assertEqual((inserted, skipped), (2, 5))
+        self.assertEqual(errors, [
+            (2, "An invalid email was provided."),
+            (3, "A user with this email already exists."),
+            (5, "The email must be a string."),
+            (6, "The row must be an object."),
+            (7, "The id must be an integer.")])
+
+        inserted, skipped = transfer.import_rows(
+            "posts", [{"title": "Post", "body": "Body.", "user_id": "1"},
+                      {"title": "Post", "body": "Body.", "user_id": "9"}])
+        self.assertEqual((inserted, skipped), (1, 1))
+
+    def test_import_reports_bad_lines_and_conflicts(self):
+        """Test that lines which are not valid JSON are reported and skipped,
+        and that rows reusing an existing ID stop the import at their batch.
+
+        """
+
+        f = io.StringIO('{"name": "Jill", "email": "jill@test.com"}\n'
+                        'not json\n'
+                        '\n'
+                        '{"name": "Jack", "email": "jack@test.com"}\n')
+        errors = []
+
+        inserted, skipped = transfer.import_rows(
+            "users", transfer.read_rows(f, "ndjson"),
+            on_error=lambda *error: errors.append(error))
+
+        self.assertEqual((inserted, skipped), (2, 1))
+        self.assertEqual(errors, [(2, "Line 2 is not valid JSON.")])
+
+        rows = [{"id": 9, "name": "John", "email": "john@test.com"},
+                {"id": 1, "name": "Jane", "email": "jane@test.com"}]
+
+        with self.assertRaises(transfer.TransferError) as context:
+            transfer.import_rows("users", rows, batch_size=1)
+
+        self.assertIn("Rows 2 to 2", str(context.exception))
+
+        with get_session() as DB:
+            self.assertEqual(len(User.all(DB)), 3)
+
+    def test_round_trip(self):
+        """Test that exported rows can be imported into an empty database,
+        in either format, with indexes deferred.
+
+        """
+
+        user = User(name="Jill", email="jill@test.com")
+        posts = [Post(title="Post {0}".format(i), body="Body, \"quoted\".",
+                      user=user) for i in range(5)]
+
+        with get_session() as DB:
+            DB.add(user)
+            DB.add_all(posts)
+
+        for format_ in transfer.FORMATS:
+            exported = {}
+            for name in ("users", "posts"):
+                f = io.StringIO()
+                transfer.write_rows(f, format_, transfer.TABLES[name].columns,
+                                    transfer.export_rows(name, batch_size=2))
+                exported[name] = f.getvalue()
+
+            with get_session() as DB:
+                DB.query(Post).delete()
+                DB.query(User).delete()
+
+            for name in ("users", "posts"):
+                rows = transfer.read_rows(io.StringIO(exported[name]),
+                                          format_)
+                transfer.import_rows(name, rows, batch_size=2,
+                                     defer_indexes=True)
+
+            with get_session() as DB:
+                self.assertEqual([p.to_dict() for p in Post.all(DB)],
+                                 [p.to_dict() for p in posts])
+
+                # The search index is rebuilt once the posts are imported.
+                if db.search_enabled():
+                    self.assertEqual(len(Post.search(DB, "quoted", 0, 10)), 5)
@@ -1,6 +1,7 @@
 
 import json
 
+from .. import purge
 from ..db import get_session
 from ..models import Post, User
 
@@ -24,6 +25,89 @@ class TestUser(AppTestCase):
         expected = [u.to_dict() for u in users]
         self.assertEqual(json.loads(rv.data), expected)
 
+    def test_list_users_paginated(self):
+        """Test that the list of users is split into pages linked together by
+        the Link header.
+
+        """
+
+        users = [User(name="User {0}".format(i),
+                      email="user{0}@test.com".format(i)) for i in range(5)]
+
+        with get_session() as DB:
+            DB.add_all(users)
+
+        rv = self.client.get("/api/user?limit=2")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), [u.to_dict() for u in users[:2]])
+        self.assertEqual(rv.headers["Link"],
+                         '</api/user?after={0}&limit=2>; rel="next"'
+                         .format(users[1].id))
+
+        rv = self.client.get("/api/user?limit=2&after={0}"
+                             .format(users[3].id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), [users[4].to_dict()])
+        self.assertNotIn("Link", rv.headers)
+
+    def test_list_users_page_size_capped(self):
+        """Test that a page never contains more than the maximum page size."""
+
+        self.app.config["MAX_PAGE_SIZE"] = 2
+
+        users = [User(name="User {0}".format(i),
+                      email="user{0}@test.com".format(i)) for i in range(3)]
+
+        with get_session() as DB:
+            DB.add_all(users)
+
+        rv = self.client.get("/api/user?limit=100")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(len(json.loads(rv.data)), 2)
+
+    def test_list_users_bad_page_arguments(self):
+        """Test the endpoint for listing users with invalid page arguments."""
+
+        rv = self.client.get("/api/user?limit=abc")
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.data)["error"],
+                         "The limit parameter must be an integer.")
+
+        rv = self.client.get("/api/user?limit=0")
+        self.assertEqual(rv.status_code, 400)
+
+        rv = self.client.get("/api/user?after=abc")
+        self.assertEqual(rv.status_code, 400)
+
+        rv = self.client.get("/api/user?after=99999999999999999999999")
+        self.assertEqual(rv.status_code, 400)
+
+    def test_list_users_streamed(self):
+        """Test that the whole list of users can be streamed."""
+
+        self.app.config["STREAM_CHUNK_SIZE"] = 2
+        self.app.config["MAX_PAGE_SIZE"] = 2
+
+        rv = self.client.get("/api/user?stream=true")
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), [])
+
+        users = [User(name="User {0}".format(i),
+                      email="user{0}@test.com".format(i)) for i in range(5)]
+
+        with get_session() as DB:
+            DB.add_all(users)
+
+        rv = self.client.get("/api/user?stream=true")
+        self.assertEqual(rv.status_code, 200)
+        self.assertTrue(rv.is_streamed)
+        self.assertEqual(json.loads(rv.data), [u.to_dict() for u in users])
+
+        rv = self.client.get("/api/user?stream=1&after={0}&limit=3"
+                             .format(users[0].id))
+        self.assertEqual(json.loads(rv.data),
+                         [u.to_dict() for u in users[1:4]])
+
     def test_list_user(self):
         """Test the endpoint for retrieving a single user."""
 
@@ -36,6 +120,55 @@ class TestUser(AppTestCase):
         self.assertEqual(rv.status_code, 200)
         self.assertEqual(json.loads(rv.data), user.to_dict())
 
+    def test_list_user_not_modified(self):
+        """Test that a user is not sent again if the client's copy is
+        current.
+
+        """
+
+        user = User(name="Jill Smith", email="jill@test.com")
+
+        with get_session() as DB:
+            DB.add(user)
+
+        url = "/api/user/{0}".format(user.id)
+        rv = self.client.get(url)
+        etag = rv.headers["ETag"]
+        self.assertEqual(etag, '"{0}.1"'.format(user.id))
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(rv.data, b"")
+
+        self.client.put(url, data=json.dumps({"name": "Jill"}))
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.headers["ETag"], '"{0}.2"'.format(user.id))
+
+    def test_list_user_fields(self):
+        """Test that a single user can be restricted to some of their
+        fields.
+
+        """
+
+        user = User(name="Jill Smith", email="jill@test.com")
+
+        with get_session() as DB:
+            DB.add(user)
+
+        rv = self.client.get("/api/user/{0}?fields=name".format(user.id))
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data), {"id": user.id,
+                                               "name": user.name})
+
+        rv = self.client.get("/api/user?fields=email")
+        self.assertEqual(json.loads(rv.data), [{"id": user.id,
+                                                "email": user.email}])
+
+        rv = self.client.get("/api/user/{0}?fields=age".format(user.id))
+        self.assertEqual(rv.status_code, 400)
+
     def test_list_user_no_user(self):
         """Test the endpoint for retrieving a single user if no user exists."""
 
@@ -106,6 +239,59 @@ class TestUser(AppTestCase):
         self.assertEqual(json.loads(rv.data)["error"],
                          "An invalid email was provided.")
 
+    def test_bulk_create_users(self):
+        """Test the endpoint for creating many users at once."""
+
+        data = [{"name": "User {0}".format(i),
+                 "email": "user{0}@test.com".format(i)} for i in range(3)]
+
+        rv = self.client.post("/api/user/bulk", data=json.dumps(data))
+        self.assertEqual(rv.status_code, 201)
+
+        returned = json.loads(rv.data)
+        self.assertEqual([{"name": u["name"], "email": u["email"]}
+                          for u in returned], data)
+
+        with get_session() as DB:
+            users = DB.query(User).order_by(User.id).all()
+
+        self.assertEqual([u.to_dict() for u in users], returned)
+
+    def test_bulk_create_users_invalid(self):
+        """Test that no users are created in bulk if any of them are invalid,
+        and that each invalid user is reported.
+
+        """
+
+        user = User(name="Jill", email="jill@test.com")
+
+        with get_session() as DB:
+            DB.add(user)
+
+        data = [{"name": "Jack", "email": "jack@test.com"},
+                {"name": "", "email": "nameless@test.com"},
+                {"name": "Jill", "email": "jill@test.com"},
+                {"name": "Jack", "email": "jack@test.com"},
+                {"name": "Jane", "email": 5},
+                {"name": "Jane", "email": ["jane@test.com"]}]
+
+        rv = self.client.post("/api/user/bulk", data=json.dumps(data))
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.data)["items"], [
+            {"index": 1, "error": "No name was provided."},
+            {"index": 2, "error": "A user with this email already exists."},
+            {"index": 3, "error": "The email was provided more than once."},
+            {"index": 4, "error": "The email must be a string."},
+            {"index": 5, "error": "The email must be a string."}])
+
+        with get_session() as DB:
+            self.assertEqual(DB.query(User).count(), 1)
+
+        rv = self.client.post("/api/user/bulk", data=json.dumps({}))
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.data)["error"],
+                         "A list of items must be provided.")
+
     def test_update_user(self):
         """Test the endpoint for updating a user."""
 
@@ -131,6 +317,38 @@ class TestUser(AppTestCase):
         self.assertEqual(updated.name, user.name)
         self.assertEqual(updated.email, data["email"])
 
+    def test_update_user_if_match(self):
+        """Test that an update is only applied if the If-Match header names
+        the current version of the user.
+
+        """
+
+        user = User(name="John", email="john@test.com")
+
+        with get_session() as DB:
+            DB.add(user)
+
+        url = "/api/user/{0}".format(user.id)
+        etag = self.client.get(url).headers["ETag"]
+
+        rv = self.client.put(url, data=json.dumps({"name": "Jack"}),
+                             headers={"If-Match": etag})
+        self.assertEqual(rv.status_code, 200)
+        self.assertNotEqual(rv.headers["ETag"], etag)
+
+        rv = self.client.put(url, data=json.dumps({"name": "James"}),
+                             headers={"If-Match": etag})
+        self.assertEqual(rv.status_code, 412)
+        self.assertEqual(json.loads(rv.data)["error"],
+                         "The user has been modified.")
+
+        rv = self.client.put(url, data=json.dumps({"name": "James"}),
+                             headers={"If-Match": '"garbage"'})
+        self.assertEqual(rv.status_code, 412)
+
+        with get_session() as DB:
+            self.assertEqual(DB.query(User).get(user.id).name, "Jack")
+
     def test_update_user_no_user(self):
         """Test the endpoint for updating a user if no such user exists."""
 
@@ -185,3 +403,36 @@ class TestUser(AppTestCase):
 
         self.assertIsNone(x)
         self.assertFalse(y)
+
+    def test_delete_user_chunked(self):
+        """Test that a user's posts can be deleted in chunks before the user
+        is.
+
+        """
+
+        user = User(name="Jill", email="jill@mail.com")
+        other = User(name="Jack", email="jack@mail.com")
+
+        with get_session() as DB:
+            DB.add_all([user, other])
+            DB.add_all([Post(title="Post", body="Body.", user=u)
+                        for u in (user, other) for _ in range(25)])
+
+        self.app.config["USER_DELETE_CHUNK_SIZE"] = 10
+
+        with self.assertQueryBudget(4):
+            rv = self.client.delete("/api/user/{0}?chunked=true".format(
+                user.id))
+        self.assertEqual(rv.status_code, 204)
+
+        with get_session() as DB:
+            self.assertIsNone(DB.query(User).get(user.id))
+            self.assertEqual(DB.query(Post).count(), 25)
+            self.assertEqual(DB.query(Post).filter(Post.user_id == user.id)
+                             .count(), 0)
+
+        progress = []
+        self.assertEqual(purge.delete_user(other.id, 10,
+                                           progress=progress.append),
+                         (1, 25))
+        self.assertEqual(progress, [10, 20, 25])
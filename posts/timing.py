@@ -0,0 +1,73 @@
+"""A breakdown of the time spent handling each request into phases, such as
+parsing the request, querying the database, serialising the results and
+rendering the response. The phases are sent to the client in a Server-Timing
+header, and a sample of requests may also be logged.
+
+"""
+
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent within the block to the named phase of the current
+    request. Does nothing outside of a request, or if Server-Timing is not
+    enabled.
+
+    """
+
+    timings = g.get("server_timing") if has_request_context() else None
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def before_request():
+    """Start timing a request, if Server-Timing is enabled."""
+
+    if current_app.config["SERVER_TIMING_ENABLED"]:
+        g.server_timing = {}
+        g.server_timing_started = time.perf_counter()
+
+
+def after_request(response):
+    """Add the Server-Timing header to a response, and log a sample of the
+    timings if configured to.
+
+    """
+
+    timings = g.pop("server_timing", None)
+    if timings is None:
+        return response
+
+    timings["total"] = time.perf_counter() - g.pop("server_timing_started")
+
+    response.headers["Server-Timing"] = ", ".join(
+        "{0};dur={1:.3f}".format(name, seconds * 1000)
+        for name, seconds in timings.items())
+
+    rate = current_app.config["SERVER_TIMING_LOG_SAMPLE_RATE"]
+    if rate and random.random() < rate:
+        logger.info(json.dumps({
+            "method": request.method,
+            "endpoint": request.endpoint,
+            "path": request.path,
+            "status": response.status_code,
+            "timings_ms": {name: round(seconds * 1000, 3)
+                           for name, seconds in timings.items()}}))
+
+    return response
@@ -0,0 +1,374 @@
+"""Streaming import and export of users and posts as newline delimited JSON
+or CSV, for moving more rows than is practical through the API.
+
+Rows are read, validated and inserted a batch at a time, so memory use does
+not depend on the size of the file.
+
+"""
+
+import csv
+import json
+import time
+from itertools import groupby, islice
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .db import search
+from .models import Post, User
+from .views.post import validate_post
+from .views.user import validate_user
+
+FORMATS = ("ndjson", "csv")
+
+
+class TransferError(Exception):
+    """Raised when an import stops part of the way through."""
+
+
+class InvalidRow(object):
+    """Stands in for a line of a file which could not be parsed, so that it
+    is reported and skipped like any other invalid row.
+
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+
+class Table(object):
+    """How the rows of one model are imported and exported."""
+
+    def __init__(self, model, columns, validate):
+        self.model = model
+        self.columns = columns
+        self.validate = validate
+
+    def convert(self, row):
+        """Return an imported row with only the known columns, and the ID
+        columns as integers. Raises a ValueError if the row is not an object
+        or an ID is not an integer. The types of the other columns are
+        checked by the table's validate function.
+
+        """
+
+        if isinstance(row, InvalidRow):
+            raise ValueError(row.error)
+
+        if not isinstance(row, dict):
+            raise ValueError("The row must be an object.")
+
+        converted = {}
+
+        for key in self.columns:
+            value = row.get(key)
+            if value is None or value == "":
+                continue
+
+            if key == "id" or key.endswith("_id"):
+                try:
+                    if isinstance(value, (bool, float)):
+                        raise ValueError()
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise ValueError("The {0} must be an integer.".format(key))
+
+            converted[key] = value
+
+        return converted
+
+
+def validate_post_row(data):
+    """Check a post to be imported, which must name its user."""
+
+    return validate_post(data) or (
+        None if "user_id" in data else "No user ID was provided.")
+
+
+TABLES = {
+    "users": Table(User, ("id", "name", "email"), validate_user),
+    "posts": Table(Post, ("id", "title", "body", "user_id"),
+                   validate_post_row),
+}
+
+
+def detect_format(path):
+    """Return the format of a file from its extension, defaulting to
+    ndjson.
+
+    """
+
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def read_rows(f, format_):
+    """Iterate over the rows of a file as dictionaries. Lines which are not
+    valid JSON are returned as an InvalidRow.
+
+    """
+
+    if format_ == "csv":
+        yield from csv.DictReader(f)
+        return
+
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield InvalidRow("Line {0} is not valid JSON.".format(number))
+
+
+def write_rows(f, format_, columns, rows):
+    """Write rows of dictionaries to a file. Returns the number written."""
+
+    count = 0
+
+    if format_ == "csv":
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+
+    for row in rows:
+        f.write(json.dumps(row))
+        f.write("\n")
+        count += 1
+
+    return count
+
+
+class Progress(object):
+    """Reports the number of rows processed and the rate of processing."""
+
+    def __init__(self, report):
+        self.report = report
+        self.start = time.time()
+        self.rows = 0
+        self.skipped = 0
+
+    def update(self, rows, skipped=0):
+        self.rows += rows
+        self.skipped += skipped
+
+        if self.report is not None:
+            elapsed = time.time() - self.start
+            self.report("{0} rows, {1} skipped, {2:.0f} rows/s".format(
+                self.rows, self.skipped,
+                self.rows / elapsed if elapsed else 0))
+
+
+def check_batch(table, batch):
+    """Validate a batch of (row number, row) pairs against each other and the
+    rows on every shard, and return the valid rows and a list of (row number,
+    error) pairs for the others.
+
+    """
+
+    rows = []
+    errors = []
+
+    for number, raw in batch:
+        try:
+            row = table.convert(raw)
+        except ValueError as e:
+            errors.append((number, str(e)))
+            continue
+
+        error = table.validate(row)
+        if error:
+            errors.append((number, error))
+        else:
+            rows.append((number, row))
+
+    if table.model is User:
+        emails = [r["email"] for _, r in rows]
+        existing = set().union(*db.gather(
+            lambda DB: User.existing_emails(DB, emails)))
+        rows, errors = reject(rows, errors, existing, "email",
+                              "A user with this email already exists.",
+                              unique=True)
+    else:
+        user_ids = list({r["user_id"] for _, r in rows})
+        existing = set().union(*db.gather(
+            lambda DB: existing_user_ids(DB, user_ids)))
+
+        rows, errors = reject(rows, errors, set(user_ids) - existing,
+                              "user_id", "No such user found.")
+
+    return [r for _, r in rows], errors
+
+
+def existing_user_ids(DB, user_ids):
+    """Return the set of the given IDs which belong to a user."""
+
+    existing = set()
+
+    # Query in chunks to stay under SQLite's limit on bound parameters.
+    for i in range(0, len(user_ids), 500):
+        existing.update(id_ for id_, in DB.query(User.id).filter(
+            User.id.in_(user_ids[i:i + 500])))
+
+    return existing
+
+
+def shard_for_row(table, row):
+    """Return the index of the shard an imported row belongs on: that of its
+    user, or for a new user without an ID, the one new users are created on.
+
+    """
+
+    if table.model is Post:
+        return db.shard_for_id(row["user_id"])
+
+    if "id" in row:
+        return db.shard_for_id(row["id"])
+
+    return db.shard_for_email(row["email"])
+
+
+def reject(rows, errors, values, key, message, unique=False):
+    """Move the rows whose value for key is one of values to errors, along
+    with those which repeat the value of an earlier row if unique is True.
+
+    """
+
+    kept = []
+    seen = set()
+
+    for number, row in rows:
+        if row[key] in values:
+            errors.append((number, message))
+        elif unique and row[key] in seen:
+            errors.append((number, "The {0} was provided more than once."
+                                 .format(key)))
+        else:
+            seen.add(row[key])
+            kept.append((number, row))
+
+    return kept, errors
+
+
+def import_rows(name, rows, batch_size=10000, defer_indexes=False,
+                report=None, on_error=None):
+    """Insert rows into a table, a batch per transaction on each shard.
+    Invalid rows are skipped. Takes the following arguments:
+
+    - name: the name of the table in TABLES.
+    - rows: an iterable of dictionaries of column values.
+    - batch_size: the number of rows inserted per transaction.
+    - defer_indexes: if True, the table's non-unique indexes, and for posts
+                     the search index, are dropped during the import and
+                     rebuilt afterwards, which is faster for large imports.
+    - report: a function called with a progress message after each batch.
+    - on_error: a function called with the number of each row which is
+                skipped, counting from 1, and the reason.
+
+    Returns a tuple of the numbers of rows inserted and skipped. Rows with
+    the ID of an existing row raise a TransferError naming their batch. The
+    batches before it remain inserted, as do the rows of the batch on any
+    shards written to before the one which failed.
+
+    """
+
+    table = TABLES[name]
+    insert = table.model.__table__.insert()
+    progress = Progress(report)
+
+    if defer_indexes:
+        drop_indexes(table)
+
+    try:
+        numbered = enumerate(rows, 1)
+
+        while True:
+            batch = list(islice(numbered, batch_size))
+            if not batch:
+                break
+
+            valid, invalid = check_batch(table, batch)
+
+            shards = {}
+            for row in valid:
+                shards.setdefault(shard_for_row(table, row), []).append(row)
+
+            try:
+                for shard, shard_rows in sorted(shards.items()):
+                    with db.get_session(shard=shard) as DB:
+                        # An executemany statement needs the same columns in
+                        # each row, which differ if only some rows have an ID.
+                        for _, group in groupby(shard_rows,
+                                                key=lambda r: "id" in r):
+                            DB.execute(insert, list(group))
+            except IntegrityError as e:
+                raise TransferError(
+                    "Rows {0} to {1} conflict with existing rows: {2}. The "
+                    "{3} rows before them were imported.".format(
+                        batch[0][0], batch[-1][0], e.orig, progress.rows))
+
+            if on_error is not None:
+                for number, error in invalid:
+                    on_error(number, error)
+
+            progress.update(len(valid), len(invalid))
+    finally:
+        if defer_indexes:
+            restore_indexes(table)
+
+    return progress.rows, progress.skipped
+
+
+def drop_indexes(table):
+    for shard in db.shards:
+        with shard.engine.begin() as connection:
+            for index in table.model.__table__.indexes:
+                index.drop(bind=connection)
+
+            if table.model is Post and db.search_enabled():
+                for trigger in ("posts_fts_insert", "posts_fts_delete",
+                                "posts_fts_update"):
+                    connection.execute("DROP TRIGGER IF EXISTS " + trigger)
+
+
+def restore_indexes(table):
+    for shard in db.shards:
+        db.create_indexes(shard.engine)
+
+        if table.model is Post and db.search_enabled():
+            with shard.engine.begin() as connection:
+                search.create(connection)
+                search.rebuild(connection)
+
+
+def export_rows(name, batch_size=10000, report=None):
+    """Iterate over every row of a table in order of ID, fetching batch_size
+    rows at a time, as dictionaries of the columns in TABLES. The shards are
+    read in turn, as each shard's IDs are greater than those of the shards
+    before it.
+
+    """
+
+    table = TABLES[name]
+    model_table = table.model.__table__
+    statement = select([model_table.c[c] for c in table.columns]) \
+        .order_by(model_table.c.id)
+    progress = Progress(report)
+
+    for shard in range(db.shard_count()):
+        with db.get_session(read_only=True, shard=shard) as DB:
+            result = DB.execute(statement)
+
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield dict(zip(table.columns, row))
+
+                progress.update(len(rows))
@@ -1,5 +1,23 @@
 
-from flask.json import jsonify
+from itertools import islice
+
+from flask import current_app, request, url_for
+from flask.json import dumps, jsonify, loads
+
+from ..timing import timed
+
+
+# The largest integer SQLite can store.
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def is_integer(value):
+    """Return whether a value parsed from JSON is an integer, which booleans
+    are not.
+
+    """
+
+    return isinstance(value, int) and not isinstance(value, bool)
 
 
 class HandleErrorMixin(object):
@@ -16,3 +34,350 @@ class HandleErrorMixin(object):
         r = jsonify({"error": message})
         r.status_code = status_code
         return r
+
+
+class PaginateMixin(object):
+    """Contains logic for keyset pagination and streaming of list
+    endpoints.
+
+    """
+
+    def streaming(self):
+        """Return whether the client asked for the whole list to be streamed
+        rather than a single page.
+
+        """
+
+        return request.args.get("stream", "").lower() in ("1", "true")
+
+    def int_argument(self, name, default=None, minimum=None):
+        """Parse an integer parameter from the query string, or return default
+        if it was not provided. Raises a ValueError if the parameter is not an
+        integer which SQLite can store, or is less than minimum.
+
+        """
+
+        value = request.args.get(name)
+        if value is None:
+            return default
+
+        try:
+            value = int(value)
+            if not -MAX_INTEGER - 1 <= value <= MAX_INTEGER:
+                raise ValueError()
+        except ValueError:
+            raise ValueError("The {0} parameter must be an integer."
+                             .format(name))
+
+        if minimum is not None and value < minimum:
+            raise ValueError("The {0} parameter must be at least {1}."
+                             .format(name, minimum))
+
+        return value
+
+    def page_arguments(self):
+        """Parse the after and limit parameters from the query string and
+        return them as a tuple. Unless the list is being streamed, the limit
+        defaults to the configured page size and is capped at the maximum page
+        size, otherwise it defaults to None. Raises a ValueError if either
+        parameter is invalid.
+
+        """
+
+        config = current_app.config
+        after = self.int_argument("after", 0)
+
+        if self.streaming():
+            return after, self.int_argument("limit", None, 1)
+
+        limit = self.int_argument("limit", config["PAGE_SIZE"], 1)
+        return after, min(limit, config["MAX_PAGE_SIZE"])
+
+    def paginate(self, items, limit, endpoint, **values):
+        """Return a response containing a page of items. Takes three
+        parameters, and any further keyword arguments are used to build the
+        URL of the next page:
+
+        - items: the serialised items, fetched with a limit of limit + 1 so
+                 that the existence of a next page can be detected.
+        - limit: the page size.
+        - endpoint: the endpoint used to build the URL of the next page.
+
+        """
+
+        with timed("render"):
+            r = jsonify(items[:limit])
+
+        if len(items) > limit:
+            url = url_for(endpoint, after=items[limit - 1]["id"], limit=limit,
+                          **values)
+            r.headers["Link"] = '<{0}>; rel="next"'.format(url)
+
+        return r
+
+    def stream(self, items):
+        """Return a response which streams items as a JSON array, encoding
+        them in chunks of the configured size as they are produced. Takes one
+        parameter:
+
+        - items: an iterable of serialised items. It is consumed after the
+                 view has returned, so must not depend on the request context.
+
+        """
+
+        chunk_size = current_app.config["STREAM_CHUNK_SIZE"]
+
+        def generate():
+            iterator = iter(items)
+            separator = "["
+
+            while True:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    break
+
+                yield separator + ",".join(dumps(i) for i in chunk)
+                separator = ","
+
+            yield "[]" if separator == "[" else "]"
+
+        return current_app.response_class(generate(),
+                                          mimetype="application/json")
+
+
+class FieldsMixin(object):
+    """Contains logic for restricting responses to a subset of fields."""
+
+    def fields(self, model):
+        """Parse the comma separated fields parameter from the query string
+        into a tuple from the model's select_fields, or None if it was not
+        provided. Raises a ModelError if any field is not a field of the
+        model.
+
+        """
+
+        fields = request.args.get("fields")
+        if fields is None:
+            return None
+
+        return model.select_fields([f.strip() for f in fields.split(",")
+                                    if f.strip()])
+
+
+class BulkMixin(object):
+    """Contains logic for endpoints which accept a list of items."""
+
+    def bulk_items(self):
+        """Parse the request data as a list of items, each of which must be a
+        JSON object. Raises a ValueError if the data is not such a list or it
+        contains more than the configured maximum number of items.
+
+        """
+
+        if not request.data:
+            raise ValueError("No data was provided.")
+
+        with timed("parse"):
+            items = loads(request.data)
+
+        if not isinstance(items, list) or not items:
+            raise ValueError("A list of items must be provided.")
+
+        if len(items) > current_app.config["MAX_BULK_ITEMS"]:
+            raise ValueError("No more than {0} items may be provided at once."
+                             .format(current_app.config["MAX_BULK_ITEMS"]))
+
+        if not all(isinstance(i, dict) for i in items):
+            raise ValueError("Each item must be an object.")
+
+        return items
+
+    def bulk_selection(self, model, data):
+        """Parse the items selected by a request which changes many items at
+        once, as either a list of IDs under "ids" or an object under "filter"
+        mapping fields of the model to the values they must equal, where an
+        empty filter selects every item. Returns a list of lists of criteria,
+        each of which selects some of the items, with each list of IDs kept
+        under SQLite's limit on bound parameters. Raises a ValueError or
+        ModelError if the selection is invalid.
+
+        """
+
+        if ("ids" in data) == ("filter" in data):
+            raise ValueError("Either a list of IDs or a filter must be "
+                             "provided.")
+
+        if "filter" in data:
+            filter_ = data["filter"]
+            if not isinstance(filter_, dict):
+                raise ValueError("The filter must be an object.")
+
+            model.select_fields(list(filter_))
+
+            for key, value in filter_.items():
+                if getattr(model, key).type.python_type is int:
+                    if not is_integer(value):
+                        raise ValueError("The {0} filter must be an integer."
+                                         .format(key))
+                elif not isinstance(value, str):
+                    raise ValueError("The {0} filter must be a string."
+                                     .format(key))
+
+            return [[getattr(model, k) == v for k, v in filter_.items()]]
+
+        ids = data["ids"]
+        if not isinstance(ids, list) or not ids or \
+                not all(is_integer(i) for i in ids):
+            raise ValueError("A list of IDs must be provided.")
+
+        if len(ids) > current_app.config["MAX_BULK_ITEMS"]:
+            raise ValueError("No more than {0} items may be provided at once."
+                             .format(current_app.config["MAX_BULK_ITEMS"]))
+
+        return [[model.id.in_(ids[i:i + 500])]
+                for i in range(0, len(ids), 500)]
+
+    def bulk_errors(self, errors):
+        """Return a response describing the items which failed validation.
+        Takes one parameter:
+
+        - errors: a list containing an error message, or None, for each item.
+
+        """
+
+        r = jsonify({"error": "One or more items were invalid.",
+                     "items": [{"index": i, "error": e}
+                               for i, e in enumerate(errors) if e]})
+        r.status_code = 400
+        return r
+
+
+class ConditionalMixin(object):
+    """Contains logic for ETags and conditional requests."""
+
+    # Set while building a response which may be shared between requests, so
+    # that it does not depend on the headers of the current request.
+    unconditional = False
+
+    def etag(self, id_, version, fields=None):
+        """Return the ETag for version of the instance with an ID of id_,
+        restricted to fields if given.
+
+        """
+
+        etag = "{0}.{1}".format(id_, version)
+
+        if fields is not None:
+            etag += ";" + ",".join(fields)
+
+        return etag
+
+    def respond(self, etag, serialize, status_code=200):
+        """Return a JSON response with an ETag, or an empty 304 response if
+        the client's copy is current, in which case nothing is serialised.
+        Takes three parameters:
+
+        - etag: the ETag of the data.
+        - serialize: a function which takes no arguments and returns the data.
+        - status_code: the HTTP status code for the response.
+
+        """
+
+        if request.method in ("GET", "HEAD") and not self.unconditional and \
+                request.if_none_match.contains_weak(etag):
+            return self.not_modified(etag)
+
+        with timed("serialize"):
+            data = serialize()
+
+        with timed("render"):
+            r = jsonify(data)
+
+        r.status_code = status_code
+        r.set_etag(etag)
+        return r
+
+    def not_modified(self, etag):
+        """Return an empty 304 response with an ETag."""
+
+        r = current_app.response_class(status=304)
+        r.set_etag(etag)
+        return r
+
+    def expected_version(self, id_):
+        """Return the version of the instance with an ID of id_ named in the
+        If-Match header, or None if the header was not provided or matches
+        any version. Raises a ValueError if the header does not name a version
+        of the instance.
+
+        """
+
+        if not request.if_match or request.if_match.star_tag:
+            return None
+
+        # The ETags of compressed responses are weak, but name the same
+        # version.
+        for etag in request.if_match.as_set(include_weak=True):
+            etag_id, _, version = etag.split(";")[0].partition(".")
+            if etag_id == str(id_) and version.isdigit():
+                return int(version)
+
+        raise ValueError("The If-Match header does not match any version of "
+                         "the resource.")
+
+
+class CacheMixin(object):
+    """Contains logic for caching responses, if the app has a response
+    cache.
+
+    """
+
+    def cached(self, key, tags, view):
+        """Return the cached response for a key, or the response from view if
+        there is none. Only successful responses are cached. Takes three
+        parameters:
+
+        - key: the cache key for the response.
+        - tags: the tags used to invalidate the cached response.
+        - view: a function which takes no arguments and returns a response.
+
+        """
+
+        cache = current_app.extensions.get("response_cache")
+        if cache is None:
+            return view()
+
+        def load():
+            self.unconditional = True
+            try:
+                r = view()
+            finally:
+                self.unconditional = False
+
+            body = r.get_data()
+            value = (body, r.status_code, list(r.headers))
+
+            if r.status_code != 200:
+                return value, None
+
+            return value, len(body)
+
+        body, status, headers = cache.get(key, tags, load)
+        r = current_app.response_class(body, status=status, headers=headers)
+
+        etag, _ = r.get_etag()
+        if status == 200 and etag and \
+                request.if_none_match.contains_weak(etag):
+            return self.not_modified(etag)
+
+        return r
+
+    def invalidate(self, *tags):
+        """Remove the cached responses labelled with any of the tags."""
+
+        cache = current_app.extensions.get("response_cache")
+        if cache is None:
+            return
+
+        for tag in tags:
+            cache.invalidate(tag)
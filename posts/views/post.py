@@ -1,43 +1,112 @@
 
-from flask import request
+from heapq import merge
+from itertools import islice
+
+from flask import current_app, request, url_for
 from flask.json import jsonify, loads
 from flask.views import MethodView
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm.exc import NoResultFound
 
 from .. import db
 from ..models import Post, User
+from ..models.errors import ModelError, StaleVersionError
+from ..timing import timed
+
+from .base import (MAX_INTEGER, BulkMixin, CacheMixin, ConditionalMixin,
+                   FieldsMixin, HandleErrorMixin, PaginateMixin)
+
+
+def validate_post(data):
+    """Check the data for a new post. Returns an error message if the data is
+    invalid, or None otherwise. Takes one argument:
+
+    - data: a dictionary containing the title and body of the post.
+
+    """
+
+    if not data.get("title", ""):
+        return "No post title was provided."
+    if not data.get("body", ""):
+        return "No post body was provided."
+
+    if not isinstance(data["title"], str):
+        return "The post title must be a string."
+    if not isinstance(data["body"], str):
+        return "The post body must be a string."
 
-from .base import HandleErrorMixin
+    return None
 
 
-class PostView(MethodView, HandleErrorMixin):
+class PostView(MethodView, HandleErrorMixin, PaginateMixin, CacheMixin,
+               ConditionalMixin, FieldsMixin):
     def get(self, user_id, post_id):
         """Retrieve the posts associated with a user in the database. Takes
         two arguments:
 
         - user_id: The ID of the user who owns the post.
-        - post_id: The ID of the post to be returned, or None if all posts are
-                   required.
+        - post_id: The ID of the post to be returned, or None if a page of
+                   posts is required.
 
         """
 
-        with db.get_session() as DB:
-            if not User.exists(DB, user_id):
-                return self.error("No such user found.", 404)
+        try:
+            fields = self.fields(Post)
+        except ModelError as e:
+            return self.error(str(e), 400)
+
+        if post_id is None:
+            try:
+                after, limit = self.page_arguments()
+            except ValueError as e:
+                return self.error(str(e), 400)
+
+            if self.streaming():
+                chunk_size = current_app.config["STREAM_CHUNK_SIZE"]
 
-            if post_id is not None:
+                with db.get_session() as DB:
+                    if not User.exists(DB, user_id):
+                        return self.error("No such user found.", 404)
+
+                # The posts are read once the request has ended, when the
+                # shard can no longer be routed from its URL.
+                shard = db.shard_for_id(user_id)
+
+                def posts():
+                    with db.get_session(read_only=True, shard=shard) as DB:
+                        yield from Post.read_iter(DB, after, limit,
+                                                  chunk_size,
+                                                  Post.user_id == user_id,
+                                                  fields=fields)
+
+                return self.stream(posts())
+
+            with db.get_session() as DB:
+                posts = Post.read_page(DB, after, limit + 1,
+                                       Post.user_id == user_id, fields=fields)
+
+                # Only an empty page could mean that the user does not exist.
+                if not posts and not User.exists(DB, user_id):
+                    return self.error("No such user found.", 404)
+
+            return self.paginate(posts, limit, request.endpoint,
+                                 user_id=user_id,
+                                 fields=request.args.get("fields"))
+
+        def view():
+            with db.get_session() as DB:
                 try:
-                    post = Post.get(DB, post_id)
+                    post, version = Post.read(DB, post_id,
+                                              Post.user_id == user_id,
+                                              fields=fields)
                 except NoResultFound:
-                    return self.error("No such post found.", 404)
-
-                response = post.to_dict()
-            else:
-                posts = User.get(DB, user_id).posts
+                    return self.not_found(DB, user_id)
 
-                response = [p.to_dict() for p in posts]
+            return self.respond(self.etag(post_id, version, fields),
+                                lambda: post)
 
-        return jsonify(response)
+        return self.cached(("post", user_id, post_id, fields),
+                           [("post", post_id), ("posts", user_id)], view)
 
     def post(self, user_id):
         """Create a post for a user in the database. Takes one argument:
@@ -49,25 +118,24 @@ class PostView(MethodView, HandleErrorMixin):
         if not request.data:
             return self.error("No data was provided.", 400)
 
-        data = loads(request.data)
-
-        title = data.get("title", "")
-        body = data.get("body", "")
+        with timed("parse"):
+            data = loads(request.data)
 
-        if not title:
-            return self.error("No post title was provided.", 400)
-        if not body:
-            return self.error("No post body was provided.", 400)
+        error = validate_post(data)
+        if error:
+            return self.error(error, 400)
 
-        with db.get_session() as DB:
-            if not User.exists(DB, user_id):
-                return self.error("No such user found.", 404)
+        # The foreign key constraint rejects posts for users who do not exist.
+        try:
+            post = db.write(lambda DB: Post.create(
+                DB, title=data["title"], body=data["body"], user_id=user_id))
+        except IntegrityError:
+            return self.error("No such user found.", 404)
 
-            post = Post.create(DB, title=title, body=body, user_id=user_id)
+        self.invalidate(("post", post.id))
 
-        r = jsonify(post.to_dict())
-        r.status_code = 201
-        return r
+        return self.respond(self.etag(post.id, post.version), post.to_dict,
+                            201)
 
     def put(self, user_id, post_id):
         """Updated a post for a user in the database. Takes two arguments:
@@ -80,7 +148,8 @@ class PostView(MethodView, HandleErrorMixin):
         if not request.data:
             return self.error("No data was provided.", 400)
 
-        data = loads(request.data)
+        with timed("parse"):
+            data = loads(request.data)
 
         title = data.get("title", "")
         body = data.get("body", "")
@@ -94,16 +163,23 @@ class PostView(MethodView, HandleErrorMixin):
         if body:
             updates["body"] = body
 
-        with db.get_session() as DB:
-            if not User.exists(DB, user_id):
-                return self.error("No such user found.", 404)
+        try:
+            expected_version = self.expected_version(post_id)
+        except ValueError as e:
+            return self.error(str(e), 412)
 
-            try:
-                post = Post.update_for_user(DB, post_id, user_id, **updates)
-            except NoResultFound:
-                return self.error("No such post found.", 404)
+        try:
+            post, version = db.write(lambda DB: Post.update_for_user(
+                DB, post_id, user_id, expected_version, **updates))
+        except NoResultFound:
+            with db.get_session() as DB:
+                return self.not_found(DB, user_id)
+        except StaleVersionError:
+            return self.error("The post has been modified.", 412)
+
+        self.invalidate(("post", post_id))
 
-        return jsonify(post.to_dict())
+        return self.respond(self.etag(post_id, version), lambda: post)
 
     def delete(self, user_id, post_id):
         """Delete a post for a user in the database. Takes two arguments:
@@ -113,11 +189,215 @@ class PostView(MethodView, HandleErrorMixin):
 
         """
 
-        with db.get_session() as DB:
-            Post.delete(DB, post_id)
+        db.write(lambda DB: Post.delete(DB, post_id, Post.user_id == user_id))
+
+        self.invalidate(("post", post_id))
 
         return "", 204  # No content.
 
+    def not_found(self, DB, user_id):
+        """Return the error for a post which was not found for a user, which
+        depends on whether the user exists. The user is only looked up once
+        the scoped statement has failed to match.
+
+        """
+
+        if not User.exists(DB, user_id):
+            return self.error("No such user found.", 404)
+
+        return self.error("No such post found.", 404)
+
+
+class PostBulkView(MethodView, HandleErrorMixin, BulkMixin, CacheMixin):
+    """Logic for endpoints which operate on many posts at once."""
+
+    def post(self, user_id):
+        """Create a list of posts for a user in a single transaction. Every
+        post is validated before any are created, and if any are invalid then
+        none are created. Takes one argument:
+
+        - user_id: the ID of the user who will own the posts.
+
+        """
+
+        try:
+            items = self.bulk_items()
+        except ValueError as e:
+            return self.error(str(e), 400)
+
+        errors = [validate_post(i) for i in items]
+        if any(errors):
+            return self.bulk_errors(errors)
+
+        rows = [{"title": i["title"], "body": i["body"], "user_id": user_id}
+                for i in items]
+
+        try:
+            with db.get_session() as DB:
+                ids = Post.bulk_create(DB, rows)
+        except IntegrityError:
+            return self.error("No such user found.", 404)
+
+        self.invalidate(*[("post", id_) for id_ in ids])
+
+        with timed("render"):
+            r = jsonify([{"id": id_, "title": row["title"],
+                          "body": row["body"]}
+                         for row, id_ in zip(rows, ids)])
+        r.status_code = 201
+        return r
+
+    def patch(self, user_id):
+        """Update the posts of a user selected by a list of IDs or a filter,
+        as described by bulk_selection, in a single transaction. The request
+        data is an object with the selection and an "updates" object of the
+        new title and body. Responds with the number of posts updated. Takes
+        one argument:
+
+        - user_id: the ID of the user who owns the posts.
+
+        """
+
+        if not request.data:
+            return self.error("No data was provided.", 400)
+
+        with timed("parse"):
+            data = loads(request.data)
+
+        if not isinstance(data, dict):
+            return self.error("An object must be provided.", 400)
+
+        changes = data.get("updates")
+        if not isinstance(changes, dict) or not changes:
+            return self.error("No updates were provided.", 400)
+
+        if not set(changes) <= {"title", "body"} or \
+                not all(isinstance(v, str) and v for v in changes.values()):
+            return self.error("Only a title and body which are non-empty "
+                              "strings can be updated.", 400)
+
+        try:
+            selection = self.bulk_selection(Post, data)
+            updates = Post.prepare_updates(**changes)
+        except (ValueError, ModelError) as e:
+            return self.error(str(e), 400)
+
+        updated = db.write(lambda DB: sum(
+            Post.update_many_for_user(DB, user_id, updates, *criterion)
+            for criterion in selection))
+
+        return self.changed(user_id, {"updated": updated}, updated)
+
+    def delete(self, user_id):
+        """Delete the posts of a user selected by a list of IDs or a filter,
+        as described by bulk_selection, in a single transaction. Responds with
+        the number of posts deleted. Takes one argument:
+
+        - user_id: the ID of the user who owns the posts.
+
+        """
+
+        if not request.data:
+            return self.error("No data was provided.", 400)
+
+        with timed("parse"):
+            data = loads(request.data)
+
+        if not isinstance(data, dict):
+            return self.error("An object must be provided.", 400)
+
+        try:
+            selection = self.bulk_selection(Post, data)
+        except (ValueError, ModelError) as e:
+            return self.error(str(e), 400)
+
+        deleted = db.write(lambda DB: sum(
+            Post.delete_many_for_user(DB, user_id, *criterion)
+            for criterion in selection))
+
+        return self.changed(user_id, {"deleted": deleted}, deleted)
+
+    def changed(self, user_id, counts, count):
+        """Return the counts of posts changed by a bulk request, or an error
+        if none were because the user does not exist.
+
+        """
+
+        if not count:
+            with db.get_session() as DB:
+                if not User.exists(DB, user_id):
+                    return self.error("No such user found.", 404)
+        else:
+            self.invalidate(("posts", user_id))
+
+        return jsonify(counts)
+
+
+class PostSearchView(MethodView, HandleErrorMixin, PaginateMixin,
+                     FieldsMixin):
+    """Logic for searching the content of posts."""
+
+    def get(self):
+        """Search the titles and bodies of posts, optionally only those of a
+        single user. The best matches are returned first, a page at a time.
+
+        """
+
+        query = request.args.get("q", "").strip()
+        if not query:
+            return self.error("No search query was provided.", 400)
+
+        if not db.search_enabled():
+            return self.error("Search is not available.", 501)
+
+        try:
+            user_id = self.int_argument("user_id")
+            offset = self.int_argument("offset", 0, 0)
+            limit = min(self.int_argument("limit",
+                                          current_app.config["PAGE_SIZE"], 1),
+                        current_app.config["MAX_PAGE_SIZE"])
+            fields = self.fields(Post)
+        except (ValueError, ModelError) as e:
+            return self.error(str(e), 400)
+
+        criterion = []
+        if user_id is not None:
+            criterion.append(Post.user_id == user_id)
+
+        # A single shard is searched for the page itself. Otherwise each
+        # shard is searched for as many matches as could be on the page, and
+        # the best of them are kept. Ranks are computed from the statistics
+        # of each shard's own index, so the merged order is approximate.
+        if user_id is None and db.shard_count() > 1:
+            shards, start = None, 0
+        else:
+            shards = [0 if user_id is None else db.shard_for_id(user_id)]
+            start = offset
+
+        # The limit of each shard's search is kept within SQLite's integers
+        # for large offsets.
+        shard_limit = min(offset - start + limit + 1, MAX_INTEGER)
+
+        try:
+            results = db.gather(lambda DB: Post.search(
+                DB, query, start, shard_limit, *criterion, fields=fields,
+                ranked=True), shards)
+        except OperationalError:
+            return self.error("The search query is invalid.", 400)
+
+        matches = merge(*results, key=lambda r: (r[0], r[1]["id"]))
+        posts = [post for _, post in islice(matches, offset - start, None)]
+
+        r = jsonify(posts[:limit])
+
+        if len(posts) > limit:
+            url = url_for(request.endpoint, q=query, user_id=user_id,
+                          offset=offset + limit, limit=limit,
+                          fields=request.args.get("fields"))
+            r.headers["Link"] = '<{0}>; rel="next"'.format(url)
+
+        return r
+
 
 def register(app, root, endpoint):
     """Add roots to an app at a specified root. Takes three parameters:
@@ -129,9 +409,26 @@ def register(app, root, endpoint):
     """
 
     post_view = PostView.as_view(endpoint)
+    bulk_view = PostBulkView.as_view("{0}.bulk".format(endpoint))
 
     app.add_url_rule(root, view_func=post_view, defaults={"post_id": None},
                      methods=["GET"])
     app.add_url_rule(root, view_func=post_view, methods=["POST"])
+    app.add_url_rule("{0}/bulk".format(root), view_func=bulk_view,
+                     methods=["POST"])
+    app.add_url_rule(root, view_func=bulk_view, methods=["PATCH", "DELETE"])
     app.add_url_rule("{0}/<int:post_id>".format(root), view_func=post_view,
                      methods=["GET", "PUT", "DELETE"])
+
+
+def register_search(app, root, endpoint):
+    """Add the route for searching posts to an app. Takes three parameters:
+
+    - app: the app to which the route should be added.
+    - root: the URL of the route.
+    - endpoint: the name of the endpoint to be used for resolving URLs.
+
+    """
+
+    app.add_url_rule(root, view_func=PostSearchView.as_view(endpoint),
+                     methods=["GET"])
@@ -1,44 +1,132 @@
 
 import re
+from itertools import islice
 
-from flask import request
+from flask import current_app, request
 from flask.json import jsonify, loads
 from flask.views import MethodView
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
-from .. import db
+from .. import db, purge
 from ..models import User
+from ..models.errors import ModelError, StaleVersionError
+from ..timing import timed
 
-from .base import HandleErrorMixin
+from .base import (BulkMixin, CacheMixin, ConditionalMixin, FieldsMixin,
+                   HandleErrorMixin, PaginateMixin)
 
 
-class UserView(MethodView, HandleErrorMixin):
+def validate_user(data):
+    """Check the data for a new user. Returns an error message if the data is
+    invalid, or None otherwise. Takes one argument:
+
+    - data: a dictionary containing the name and email of the user.
+
+    """
+
+    name = data.get("name", "")
+    email = data.get("email", "")
+
+    if not name:
+        return "No name was provided."
+
+    if not email:
+        return "No email was provided."
+
+    if not isinstance(name, str):
+        return "The name must be a string."
+    if not isinstance(email, str):
+        return "The email must be a string."
+
+    # Very basic sanity check for a valid email.
+    # (something without @)@(something without @).(something without @)
+    if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+        return "An invalid email was provided."
+
+    return None
+
+
+def email_elsewhere(email, shard):
+    """Return whether an email belongs to a user on a shard other than the
+    one with an index of shard. Emails are unique within each shard by the
+    database's index, and across shards by checking the others first, which
+    does not prevent two concurrent requests from adding the same email to
+    different shards.
+
+    """
+
+    others = [i for i in range(db.shard_count()) if i != shard]
+
+    return any(db.gather(lambda DB: User.existing_emails(DB, [email]),
+                         others))
+
+
+class UserView(MethodView, HandleErrorMixin, PaginateMixin, CacheMixin,
+               ConditionalMixin, FieldsMixin):
     """Logic for various endpoints related to users."""
 
     def get(self, user_id):
-        """Retrieve a single user or every user from the database, depending on
-        whether or not user_id is None. Takes one argument:
+        """Retrieve a single user or a page of users from the database,
+        depending on whether or not user_id is None. Takes one argument:
 
         - user_id: the ID of the user to be retrived, or None for all users.
 
         """
 
-        response = None
+        try:
+            fields = self.fields(User)
+        except ModelError as e:
+            return self.error(str(e), 400)
+
+        if user_id is None:
+            try:
+                after, limit = self.page_arguments()
+            except ValueError as e:
+                return self.error(str(e), 400)
+
+            # Each shard's IDs are greater than those of the shards before
+            # it, so the users are read from each shard in turn, starting
+            # with the one holding the ID after which the page starts.
+            shards = range(db.shard_for_id(after), db.shard_count())
 
-        if user_id is not None:
+            if self.streaming():
+                chunk_size = current_app.config["STREAM_CHUNK_SIZE"]
+
+                def users():
+                    for shard in shards:
+                        with db.get_session(read_only=True,
+                                            shard=shard) as DB:
+                            yield from User.read_iter(DB, after, limit,
+                                                      chunk_size,
+                                                      fields=fields)
+
+                return self.stream(islice(users(), limit))
+
+            users = []
+            for shard in shards:
+                with db.get_session(shard=shard) as DB:
+                    users += User.read_page(DB, after, limit + 1 - len(users),
+                                            fields=fields)
+
+                if len(users) > limit:
+                    break
+
+            return self.paginate(users, limit, "users.list",
+                                 fields=request.args.get("fields"))
+
+        def view():
             try:
                 with db.get_session() as DB:
-                    user = User.get(DB, user_id)
+                    user, version = User.read(DB, user_id, fields=fields)
             except NoResultFound:
                 return self.error("No user was found.", 404)
 
-            response = user.to_dict()
-        else:
-            with db.get_session() as DB:
-                users = User.all(DB)
-            response = [u.to_dict() for u in users]
+            return self.respond(self.etag(user_id, version, fields),
+                                lambda: user)
 
-        return jsonify(response)
+        return self.cached(("user", user_id, fields), [("user", user_id)],
+                           view)
 
     def post(self):
         """Add a user to the database based on the information provided in the
@@ -47,28 +135,27 @@ class UserView(MethodView, HandleErrorMixin):
         if not request.data:
             return self.error("No data was provided.", 400)
 
-        data = loads(request.data)
+        with timed("parse"):
+            data = loads(request.data)
 
-        name = data.get("name", "")
-        email = data.get("email", "")
+        error = validate_user(data)
+        if error:
+            return self.error(error, 400)
 
-        if not name:
-            return self.error("No name was provided.", 400)
+        shard = db.shard_for_email(data["email"])
+        if email_elsewhere(data["email"], shard):
+            return self.error("A user with this email already exists.", 409)
 
-        if not email:
-            return self.error("No email was provided.", 400)
+        try:
+            u = db.write(lambda DB: User.create(DB, name=data["name"],
+                                                email=data["email"]),
+                         shard)
+        except IntegrityError:
+            return self.error("A user with this email already exists.", 409)
 
-        # Very basic sanity check for a valid email.
-        # (something without @)@(something without @).(something without @)
-        if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
-            return self.error("An invalid email was provided.", 400)
+        self.invalidate(("user", u.id))
 
-        with db.get_session() as DB:
-            u = User.create(DB, name=name, email=email)
-
-        r = jsonify(u.to_dict())
-        r.status_code = 201
-        return r
+        return self.respond(self.etag(u.id, u.version), u.to_dict, 201)
 
     def put(self, user_id):
         """Update a user in the database based on the data in the request.
@@ -81,7 +168,8 @@ class UserView(MethodView, HandleErrorMixin):
         if not request.data:
             return self.error("No data was provided.", 400)
 
-        data = loads(request.data)
+        with timed("parse"):
+            data = loads(request.data)
 
         name = data.get("name", "")
         email = data.get("email", "")
@@ -95,27 +183,114 @@ class UserView(MethodView, HandleErrorMixin):
         if email:
             updates["email"] = email
 
+            if email_elsewhere(email, db.shard_for_id(user_id)):
+                return self.error("A user with this email already exists.",
+                                  409)
+
         try:
-            with db.get_session() as DB:
-                user = User.update(DB, user_id, **updates)
+            expected_version = self.expected_version(user_id)
+        except ValueError as e:
+            return self.error(str(e), 412)
+
+        try:
+            user, version = db.write(lambda DB: User.update(
+                DB, user_id, expected_version, **updates))
         except NoResultFound:
             return self.error("No user was found.", 404)
+        except StaleVersionError:
+            return self.error("The user has been modified.", 412)
+        except IntegrityError:
+            return self.error("A user with this email already exists.", 409)
 
-        return jsonify(user.to_dict())
+        self.invalidate(("user", user_id))
+
+        return self.respond(self.etag(user_id, version), lambda: user)
 
     def delete(self, user_id):
-        """Removes a user in the database. Takes one argument:
+        """Removes a user in the database, along with their posts. If the
+        chunked parameter is true the posts are deleted in a series of short
+        transactions first, which is slower but does not block other writers
+        for long if the user has many posts. Takes one argument:
 
         - user_id: the ID of the user to be deleted.
 
         """
 
-        with db.get_session() as DB:
-            User.delete(DB, user_id)
+        if request.args.get("chunked", "").lower() in ("1", "true"):
+            config = current_app.config
+
+            def progress(deleted):
+                current_app.logger.info("Deleted %d posts of user %d.",
+                                        deleted, user_id)
+
+            purge.delete_user(user_id, config["USER_DELETE_CHUNK_SIZE"],
+                              config["USER_DELETE_PACE"], progress)
+        else:
+            db.write(lambda DB: User.delete(DB, user_id))
+
+        # The user's posts are deleted with them.
+        self.invalidate(("user", user_id), ("posts", user_id))
 
         return "", 204  # No content
 
 
+class UserBulkView(MethodView, HandleErrorMixin, BulkMixin, CacheMixin):
+    """Logic for endpoints which operate on many users at once."""
+
+    def post(self):
+        """Add a list of users to the database in a single transaction. Every
+        user is validated before any are added, and if any are invalid then
+        none are added.
+
+        """
+
+        try:
+            items = self.bulk_items()
+        except ValueError as e:
+            return self.error(str(e), 400)
+
+        errors = [validate_user(i) for i in items]
+        rows = [{"name": i.get("name"), "email": i.get("email")}
+                for i in items]
+
+        # Check for emails which are repeated in the request or which already
+        # belong to a user, so that they can be reported against each item.
+        seen = set()
+        for index, row in enumerate(rows):
+            if errors[index]:
+                continue
+            if row["email"] in seen:
+                errors[index] = "The email was provided more than once."
+            seen.add(row["email"])
+
+        existing = set().union(*db.gather(
+            lambda DB: User.existing_emails(DB, seen)))
+
+        for index, row in enumerate(rows):
+            if not errors[index] and row["email"] in existing:
+                errors[index] = "A user with this email already exists."
+
+        if any(errors):
+            return self.bulk_errors(errors)
+
+        # The users are all created on one shard, so that they are created in
+        # a single transaction.
+        with db.get_session(shard=db.shard_for_email(rows[0]["email"])) as DB:
+            try:
+                ids = User.bulk_create(DB, rows)
+            except IntegrityError:
+                DB.rollback()
+                return self.error("A user with one of the provided emails "
+                                  "already exists.", 409)
+
+        self.invalidate(*[("user", id_) for id_ in ids])
+
+        with timed("render"):
+            r = jsonify([dict(row, id=id_) for row, id_ in zip(rows, ids)])
+        r.status_code = 201
+        return r
+
+
 def register(app, root, endpoint):
     """Add roots to an app at a specified root. Takes three parameters:
 
@@ -126,11 +301,14 @@ def register(app, root, endpoint):
     """
 
     user_view = UserView.as_view(endpoint)
+    bulk_view = UserBulkView.as_view("{0}.bulk".format(endpoint))
 
     app.add_url_rule(root, view_func=user_view, defaults={"user_id": None},
                      methods=["GET"], endpoint="{0}.list".format(endpoint))
     app.add_url_rule(root, view_func=user_view, methods=["POST"],
                      endpoint="{0}.create".format(endpoint))
+    app.add_url_rule("{0}/bulk".format(root), view_func=bulk_view,
+                     methods=["POST"])
     app.add_url_rule("{0}/<int:user_id>".format(root), view_func=user_view,
                      methods=["GET"], endpoint="{0}.view".format(endpoint))
     app.add_url_rule("{0}/<int:user_id>".format(root), view_func=user_view,
@@ -0,0 +1,9 @@
+"""The app instance for WSGI servers, such as Gunicorn:
+
+    gunicorn --config gunicorn.conf.py posts.wsgi:app
+
+"""
+
+from .app import create_app
+
+app = create_app()
@@ -1,5 +1,9 @@
+"""Run the app with the Flask development server, which is only suitable for
+development. See gunicorn.conf.py for serving the app in production.
 
-from posts.app import app
+"""
+
+from posts.wsgi import app
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=80)